@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+# Import the configuration file for the nodes to get the large value settings
+import nodes_config as cfg
+
+# Import XML RPC client to send the chunks as binary instead of escaped strings
+import xmlrpc.client
+
+# Import threading to lock the uploads in progress
+import threading
+
+# Import time to expire uploads that were never finished
+import time
+
+# Import uuid for the ids of the large values
+import uuid
+
+# Import zlib for compression that is always available
+import zlib
+
+# Import lz4 for faster compression when it is installed
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+"""
+Large value support for the kv nodes.
+A value of at least large_value_size bytes is compressed by the client and sent to the node in chunks as binary. The
+node keeps the compressed bytes as a Blob and never decompresses them, replication and snapshots send the same
+compressed bytes on in chunks, and a get or a snapshot only carries a description of a large value so the client or
+the syncing node can read the chunks itself.
+"""
+
+
+# Class for a large value as it is kept on the node, compressed with the codec it was sent with
+class Blob:
+    def __init__(self, blob_id, codec, data):
+        # Id of the value, a changed value gets a new id
+        self.blob_id = blob_id
+        # Codec the data is compressed with
+        self.codec = codec
+        # The compressed bytes
+        self.data = data
+
+    # Short form for the verbose logging instead of the whole value
+    def __str__(self):
+        return "<blob {} {} bytes {}>".format(self.blob_id, len(self.data), self.codec)
+
+
+# Class for the chunks of large values that are still being uploaded to the node
+class Uploads:
+    def __init__(self):
+        # Chunks keyed by upload id, each is (created time, {chunk index: bytes})
+        self.uploads = {}
+        # Lock for the uploads because the XML RPC server and the sync worker both use them
+        self.lock = threading.Lock()
+
+    # Keep a chunk of an upload, sending the same chunk again just replaces it
+    def add(self, upload_id, index, data):
+        with self.lock:
+            # Drop the uploads that were never finished
+            now = time.monotonic()
+            for old_id, (created, _) in list(self.uploads.items()):
+                if now - created > cfg.upload_timeout:
+                    self.uploads.pop(old_id)
+            self.uploads.setdefault(upload_id, (now, {},))[1][index] = binary_data(data)
+
+    # Put the chunks of a finished upload together and forget about them
+    def take(self, upload_id):
+        with self.lock:
+            chunks = self.uploads.pop(upload_id)[1]
+        return b"".join(chunks[index] for index in sorted(chunks))
+
+
+# Get the bytes from a binary argument, the XML RPC server hands them over wrapped in Binary
+def binary_data(data):
+    if isinstance(data, xmlrpc.client.Binary):
+        return data.data
+    return data
+
+
+# Compress the bytes of a large value with the configured codec, returns (codec, bytes)
+def compress(data):
+    # Use lz4 if it is configured and installed, zlib otherwise
+    if cfg.value_compression == "lz4" and lz4 is not None:
+        codec, compressed = "lz4", lz4.frame.compress(data)
+    elif cfg.value_compression in ["lz4", "zlib"]:
+        codec, compressed = "zlib", zlib.compress(data)
+    else:
+        return "none", data
+    # Keep the value as it is when compressing does not make it smaller
+    if len(compressed) >= len(data):
+        return "none", data
+    return codec, compressed
+
+
+# Decompress the bytes of a large value
+def decompress(codec, data):
+    if codec == "lz4":
+        return lz4.frame.decompress(data)
+    elif codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+# Get the value to send back for a get, a large value is only described
+def reply_value(value):
+    if isinstance(value, Blob):
+        return {"blob_id": value.blob_id, "codec": value.codec, "size": len(value.data)}
+    return value
+
+
+# Read the compressed chunks of a large value from a node given its description
+# Returns None when the value changed on the node between reading the description and the chunks
+def read_blob(node, key, description):
+    chunks = []
+    for offset in range(0, description.get("size"), cfg.value_chunk_size):
+        chunk = node.get_chunk(key, description.get("blob_id"), offset)
+        if chunk == "NULL":
+            return None
+        chunks.append(binary_data(chunk))
+    return Blob(description.get("blob_id"), description.get("codec"), b"".join(chunks))
+
+
+# Send a large value to a node in chunks and then call the method that stores it, the bytes are sent as they are
+def send_blob(node, method, key, blob):
+    for index, offset in enumerate(range(0, len(blob.data), cfg.value_chunk_size)):
+        node.upload_chunk(key, blob.blob_id, index,
+                          xmlrpc.client.Binary(blob.data[offset:offset + cfg.value_chunk_size]))
+    return getattr(node, method)(key, blob.blob_id, blob.codec)
+
+
+# Client side connection to a node that sends and reads large values in compressed chunks
+class LargeValueProxy:
+    def __init__(self, node):
+        # Connection to the node
+        self.node = node
+
+    # Put a value, large values are compressed and uploaded in chunks
+    def put(self, key, value):
+        data = value.encode("utf-8")
+        # Small values go through the normal put
+        if len(data) < cfg.large_value_size:
+            return self.node.put(key, value)
+        codec, data = compress(data)
+        return send_blob(self.node, "put_upload", key, Blob(uuid.uuid4().hex, codec, data))
+
+    # Get a value, large values are read in chunks and decompressed
+    def get(self, key):
+        value = self.node.get(key)
+        # Keep trying while the value is large, it can change between reading the description and the chunks
+        while isinstance(value, dict):
+            blob = read_blob(self.node, key, value)
+            if blob is not None:
+                return decompress(blob.codec, blob.data).decode("utf-8")
+            value = self.node.get(key)
+        return value
+
+    # Remove a value, the contents of a large value are gone with it so only say a large value was removed
+    def remove(self, key):
+        value = self.node.remove(key)
+        if isinstance(value, dict):
+            return "LARGE_VALUE"
+        return value
+
+    # Every other method goes straight to the node
+    def __getattr__(self, method):
+        return getattr(self.node, method)
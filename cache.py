@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+# Import the configurations for the nodes and clients to get the cache settings
+import nodes_config
+import clients_config
+
+# Import the sharded proxy so each shard's invalidations are followed separately
+from sharding import ShardedNodeProxy
+
+# Import collections for the bounded invalidation log and the LRU order of the cache
+import collections
+
+# Import threading to lock the invalidation log
+import threading
+
+# Import time for the epochs and the cache expiry
+import time
+
+"""
+Client side read cache for the kv nodes.
+Every node keeps a short log of the keys changed by puts and removes, numbered in order. A cached client only goes
+back to the node for keys it does not have, and once every refresh interval asks the node which keys changed since
+the last time so it can drop them. When the node can not answer that, because it restarted or the log moved past
+the client, the whole cache is dropped.
+"""
+
+
+# Class for the log of changed keys a node hands out to cached clients
+class InvalidationLog:
+    def __init__(self):
+        # Epoch of the log, a new epoch tells clients to drop everything they have cached
+        self.epoch = time.time()
+        # Number of the last change
+        self.seq = 0
+        # The most recent changes as (seq, key), older ones fall off the front
+        self.log = collections.deque(maxlen=nodes_config.invalidation_log_size)
+        # Lock for the log because the XML RPC server and the sync worker both use it
+        self.lock = threading.Lock()
+
+    # Record that a key was changed by a put or remove
+    def record(self, key):
+        with self.lock:
+            self.seq += 1
+            self.log.append((self.seq, key,))
+
+    # Start a new epoch, used when the data changed without the individual keys being recorded
+    def reset(self):
+        with self.lock:
+            self.epoch = time.time()
+            self.seq = 0
+            self.log.clear()
+
+    # Get the keys changed after the given change number in the given epoch
+    def since(self, epoch, seq):
+        with self.lock:
+            # A different epoch or a gap in the log means the client can not know what changed
+            if epoch != self.epoch or seq > self.seq or (self.log and seq < self.log[0][0] - 1):
+                return {"epoch": self.epoch, "seq": self.seq, "reset": True, "keys": []}
+            # Each key only once, in the order they changed
+            keys = list(dict.fromkeys(key for change, key in self.log if change > seq))
+            return {"epoch": self.epoch, "seq": self.seq, "reset": False, "keys": keys}
+
+
+# Client side connection to a node that keeps recently read values in a bounded cache
+class CachedNodeProxy:
+    def __init__(self, node, mode):
+        # Connection to the node, a ServerProxy or a ShardedNodeProxy
+        self.node = node
+        # Consistency mode of the nodes, linearizable reads always go to the node
+        self.mode = mode
+        # Cached values in LRU order, each is (value, expiry time)
+        self.cache = collections.OrderedDict()
+        # Where to ask for invalidations, every shard keeps its own log
+        self.sources = node.shards if isinstance(node, ShardedNodeProxy) else [node]
+        # Epoch and change number seen from each source, epoch 0 makes the first refresh reset the cache
+        self.cursors = [(0.0, 0,) for _ in self.sources]
+        # When the cache was last refreshed
+        self.last_refresh = 0.0
+
+    # Drop the cached keys that changed on the nodes, at most once every refresh interval unless forced
+    def refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self.last_refresh < clients_config.cache_refresh:
+            return
+        self.last_refresh = now
+        # For each of the sources
+        for i, source in enumerate(self.sources):
+            epoch, seq = self.cursors[i]
+            changes = source.invalidations(epoch, seq)
+            # The node could not say what changed so drop everything
+            if changes.get("reset"):
+                self.cache.clear()
+            for key in changes.get("keys"):
+                self.cache.pop(key, None)
+            self.cursors[i] = (changes.get("epoch"), changes.get("seq"),)
+
+    # Put a value in the cache and drop the least recently used values over the size limit
+    def store(self, key, value):
+        self.cache[key] = (value, time.monotonic() + clients_config.cache_ttl,)
+        self.cache.move_to_end(key)
+        while len(self.cache) > clients_config.cache_size:
+            self.cache.popitem(last=False)
+
+    # Get the value for a key from the cache, or from the node when it is not cached
+    def get(self, key):
+        # Linearizable reads can not be served from a copy
+        if self.mode == "linearizable":
+            return self.node.get(key)
+
+        self.refresh()
+        # Use the cached value if it has not expired
+        if key in self.cache:
+            value, expires = self.cache[key]
+            if time.monotonic() < expires:
+                self.cache.move_to_end(key)
+                return value
+            self.cache.pop(key)
+
+        value = self.node.get(key)
+        # Only cache values that exist, a missing key may still be on its way to the node
+        if value != "NULL":
+            self.store(key, value)
+        # A sequential client that read a newer value must not read older values of other keys from the cache after it
+        # Every change the node applied before this value is already in its log, so refreshing now drops them
+        if self.mode == "sequential":
+            self.refresh(force=True)
+        return value
+
+    # Put through to the node and keep the new value so this client reads its own write
+    def put(self, key, value):
+        result = self.node.put(key, value)
+        if self.mode != "linearizable":
+            self.store(key, value)
+        return result
+
+    # Remove through to the node and drop the cached value
+    def remove(self, key):
+        self.cache.pop(key, None)
+        return self.node.remove(key)
+
+    # Compare and set on the node, drop the cached value so this client reads the result back
+    def cas(self, key, expected, new):
+        self.cache.pop(key, None)
+        return self.node.cas(key, expected, new)
+
+    # Increment on the node, drop the cached value so this client reads the result back
+    def incr(self, key, delta):
+        self.cache.pop(key, None)
+        return self.node.incr(key, delta)
+
+    # Put if absent on the node, drop the cached value so this client reads the result back
+    def put_if_absent(self, key, value):
+        self.cache.pop(key, None)
+        return self.node.put_if_absent(key, value)
+
+    # Every other method goes straight to the node
+    def __getattr__(self, method):
+        return getattr(self.node, method)
@@ -13,3 +13,13 @@ clients = [
         "test_file": "test_data_1.txt"
     }
 ]
+
+"""
+Configuration for the client side read cache
+- Cache Size: most values kept in the cache
+- Cache TTL: seconds a cached value is used before it is read from the node again
+- Cache Refresh: seconds between asking the node which keys changed, also how stale a cached read can be
+"""
+cache_size = 1000
+cache_ttl = 5.0
+cache_refresh = 0.1
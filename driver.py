@@ -10,11 +10,14 @@ import nodes_config as cfg
 import client
 
 # Import the kv nodes initialization method to start the processes
-from kv_node import init_kv_node
+from kv_node import init_kv_node, init_sharded_kv_node
 
 # Import Process to startup the kv nodes
 from multiprocessing import Process
 
+# Import XML RPC client to tell the kv nodes to shut down
+import xmlrpc.client
+
 # Import for argparse for command line arguments
 import argparse
 
@@ -115,27 +118,81 @@ def init_kv_nodes(mode, verbose):
         port = cfg.nodes[i].get("port")
         # Get the node id
         node_id = cfg.nodes[i].get("node_id")
-        # Create a process to initialize the node with the arguments
+        # Start the node
+        add_kv_node(address, port, node_id, mode, verbose)
+
+
+# Start a single KV node process, it joins the running cluster through gossip with the configured nodes
+def add_kv_node(address, port, node_id, mode, verbose):
+    # Create a process to initialize the node with the arguments, one process per shard when sharding is enabled
+    if cfg.shards > 1:
+        p = Process(target=init_sharded_kv_node, args=(address, port, node_id, mode, verbose, cfg.shards,))
+    else:
         p = Process(target=init_kv_node, args=(address, port, node_id, mode, verbose,))
-        # Start the process
-        p.start()
-        # Append the process to the the list of nodes
-        kv_nodes.append(p)
+    # Start the process
+    p.start()
+    # Append the process and where to reach it to the the list of nodes
+    kv_nodes.append({"node_id": node_id, "address": address, "port": port, "process": p})
+
+
+# Stop a single running KV node, it leaves the cluster without restarting the others
+def remove_kv_node(node_id, mode):
+    # For each of the running nodes
+    for node in list(kv_nodes):
+        # Only stop the node with the matching id
+        if node.get("node_id") != node_id:
+            continue
+        # Send the pending updates then shut the node down
+        stop_kv_node_rpc(node, "flush")
+        stop_kv_node_rpc(node, "shutdown")
+        # Wait for the process to exit and remove it from the list
+        join_kv_node(node)
+        kv_nodes.remove(node)
+        print("Killed KV Node {} with {} consistency...".format(node_id, mode))
 
 
 # Kill the currently running KV nodes with parameter of type of consistency
 def kill_kv_nodes(mode):
+    # Flush the pending updates on every node first while all of them are still up to receive them
+    for node in kv_nodes:
+        stop_kv_node_rpc(node, "flush")
+
+    # Then tell each of the nodes to shut down
+    for node in kv_nodes:
+        stop_kv_node_rpc(node, "shutdown")
+
     # counter for the nodes
     count = 1
     # While there are nodes in the list
     while kv_nodes:
         # Get each nodes object by popping it from the list
-        p = kv_nodes.pop()
-        # Terminate the process
-        p.terminate()
+        node = kv_nodes.pop()
+        # Wait for the process to exit
+        join_kv_node(node)
         print("Killed KV Node {} with {} consistency...".format(count, mode))
         count += 1
 
 
+# Call the flush or shutdown method on a running node
+def stop_kv_node_rpc(node, method):
+    # Create a connection to the node
+    proxy = xmlrpc.client.ServerProxy("http://" + node.get("address") + ":" + str(node.get("port")))
+    try:
+        getattr(proxy, method)()
+    # The node is already down, terminate will take care of it
+    except (OSError, xmlrpc.client.Error):
+        pass
+
+
+# Wait for a node process to exit after the shutdown and terminate it if it does not
+def join_kv_node(node):
+    p = node.get("process")
+    # Give the process a chance to exit on its own after the shutdown
+    p.join(timeout=5)
+    # Terminate the process if it is still running
+    if p.is_alive():
+        p.terminate()
+
+
 if __name__ == "__main__":
     main()
@@ -6,12 +6,30 @@ import queue
 # Import the configuration file for the nodes to start up connections
 import nodes_config as cfg
 
-# Import XML RPC server to receive data
-from xmlrpc.server import SimpleXMLRPCServer
-
-# Import XML RPC client to send data
+# Import XML RPC client to send chunks of large values as binary
 import xmlrpc.client
 
+# Import the gossip membership to find the other nodes and detect failures
+from membership import Membership
+
+# Import the state transfer to sync a new node from a snapshot of another
+from state_transfer import StateTransfer
+
+# Import the invalidation log for clients that cache what they read
+from cache import InvalidationLog
+
+# Import the large value support to keep, replicate, and read large values in compressed chunks
+from blobs import Blob, Uploads, reply_value, send_blob
+
+# Import the router and shard ports to run a node as one process per shard
+from sharding import ShardRouter, ThreadingXMLRPCServer, shard_port
+
+# Import Process to start the shards of a sharded node
+from multiprocessing import Process
+
+# Import signal so a terminated router can still stop its shards
+import signal
+
 # Import threading to update other without waiting
 import threading
 
@@ -21,21 +39,25 @@ import random
 
 
 # Initialize the kv node with an address and port number
-def init_kv_node(address, port, node_id, mode, verbose):
-    # Create the XML RPC server object
-    server = SimpleXMLRPCServer((address, port), allow_none=True, logRequests=False,)
+# The shard is only set when the node is one of the shards of a sharded node
+def init_kv_node(address, port, node_id, mode, verbose, shard=None):
+    # Create the XML RPC server object, threaded so a node waiting on another node can still answer requests
+    server = ThreadingXMLRPCServer((address, port), allow_none=True, logRequests=False,)
 
     # If the mode is eventual then start the eventual instance with the arguments for XML RPC
     if mode == "eventual":
-        server.register_instance(EventualNode(address, port, node_id, verbose, ))
+        node = EventualNode(address, port, node_id, verbose, shard, )
 
     # If the mode is sequential then start the eventual instance with the arguments for XML RPC
     elif mode == "sequential":
-        server.register_instance(SequentialNode(address, port, node_id, verbose, ))
+        node = SequentialNode(address, port, node_id, verbose, shard, )
 
     # If the mode is linearizable then start the eventual instance with the arguments for XML RPC
     elif mode == "linearizable":
-        server.register_instance(LinearizableNode(address, port, node_id, verbose, ))
+        node = LinearizableNode(address, port, node_id, verbose, shard, )
+
+    # Register the node instance with the XML RPC server
+    server.register_instance(node)
 
     print("Node {} started on {}:{}! Using {} consistency...".format(node_id, address, port, mode))
 
@@ -44,15 +66,100 @@ def init_kv_node(address, port, node_id, mode, verbose):
     else:
         print("Node {} Verbose Logging Disabled!".format(node_id))
 
+    # Start the thread that stops the XML RPC server once the node gets the shutdown signal
+    threading.Thread(target=wait_for_shutdown, args=(server, node,)).start()
+
     # Start the thread that runs the XML RPC server listener
     server.serve_forever()
+    # Release the listening socket after the node has been shut down
+    server.server_close()
+
+    print("Node {} stopped on {}:{}".format(node_id, address, port))
+
+
+# Initialize a node as one process per shard with a router on the node's address and port
+def init_sharded_kv_node(address, port, node_id, mode, verbose, shards):
+    # Start a normal kv node process for each of the shards on its own port
+    shard_processes = []
+    for shard in range(shards):
+        p = Process(target=init_kv_node, args=(address, shard_port(port, shard), node_id, mode, verbose, shard,))
+        p.start()
+        shard_processes.append(p)
+
+    # Create the XML RPC server for the router, threaded so requests for different shards do not wait on each other
+    server = ThreadingXMLRPCServer((address, port), allow_none=True, logRequests=False,)
+    router = ShardRouter(address, port, node_id, shards, verbose)
+    server.register_instance(router)
+
+    print("Node {} router started on {}:{}! Using {} shards...".format(node_id, address, port, shards))
+
+    # Start the thread that stops the XML RPC server once the router gets the shutdown signal
+    threading.Thread(target=wait_for_shutdown, args=(server, router,)).start()
+
+    # Turn a terminate of the router into an exit so the shards below are stopped with it
+    signal.signal(signal.SIGTERM, exit_on_terminate)
+
+    try:
+        # Start the XML RPC server listener for the router
+        server.serve_forever()
+    finally:
+        # Release the listening socket after the node has been shut down
+        server.server_close()
+        # Only the shutdown RPC also shuts the shards down, otherwise they are terminated right away
+        shut_down = router.shutdown_event.is_set()
+        # Let the shutdown thread finish when the router did not get the shutdown RPC
+        router.shutdown_event.set()
+
+        # Wait for the shards to exit, or terminate them so they do not keep running with their ports bound
+        for p in shard_processes:
+            p.join(timeout=5 if shut_down else 0)
+            if p.is_alive():
+                p.terminate()
+                p.join()
+
+    print("Node {} router stopped on {}:{}".format(node_id, address, port))
+
+
+# Signal handler that exits through the normal cleanup instead of dying on the spot
+def exit_on_terminate(signum, frame):
+    raise SystemExit(0)
+
+
+# Static worker thread to stop the XML RPC server once the node has been told to shut down
+def wait_for_shutdown(server, node):
+    # Block until the shutdown RPC sets the event
+    node.shutdown_event.wait()
+    # Stop serve_forever, this has to happen outside of the request handler or it would deadlock
+    server.shutdown()
+
+
+# Static helper to block on the update queue and collect the next batch of updates
+def next_update_batch(update_queue, linger, batch_size):
+    # Block until there is work on the queue, the worker wakes up as soon as something arrives
+    batch = [update_queue.get()]
+    # Updates that arrive within the linger window are sent along in the same batch
+    deadline = time.monotonic() + linger
+    # Keep collecting until the batch is full or the shutdown signal (None) shows up
+    while len(batch) < batch_size and batch[-1] is not None:
+        remaining = deadline - time.monotonic()
+        try:
+            # Wait for the rest of the linger window if there is any left
+            if remaining > 0:
+                batch.append(update_queue.get(timeout=remaining))
+            # Otherwise only take what is already waiting in the queue
+            else:
+                batch.append(update_queue.get_nowait())
+        # Nothing else arrived in time so send what we have
+        except queue.Empty:
+            break
+    return batch
 
 
 # Class functionality for eventual consistency kv
 # Running everything in an instance will allow instance variables and running everything in-memory
 class EventualNode:
     # Initialize the object
-    def __init__(self, address, port, node_id, verbose):
+    def __init__(self, address, port, node_id, verbose, shard=None):
         # Set the address
         self.address = address
         # Set the port
@@ -61,126 +168,388 @@ class EventualNode:
         self.node_id = node_id
         # This is what is going to be the node's Key/Value store in memory
         self.data = {}
-        # This will store a list of the other nodes running
-        self.other_nodes = []
+        # Membership of the cluster, keeps track of which other nodes are running
+        self.membership = Membership(address, port, node_id, verbose, shard)
+        # Snapshots for other nodes and the writes buffered while this node syncs
+        self.state_transfer = StateTransfer(node_id, verbose)
+        # Keys changed by puts and removes, for clients that cache what they read
+        self.invalidation_log = InvalidationLog()
+        # Chunks of large values that are still being uploaded
+        self.uploads = Uploads()
+        # Lock for changing the data, reentrant because atomic operations put while holding it
+        self.lock = threading.RLock()
+        # Version of the last atomic operation result for each key, so an older result never replaces a newer one
+        self.versions = {}
+        # Background worker threads that are still sending updates to the other nodes
+        self.workers = []
+        # Set when the node has been told to shut down
+        self.shutdown_event = threading.Event()
         # Verbose logging option for more data to be printed
         self.verbose = verbose
 
-        # Create connections to the other nodes but skip self
-        for node in cfg.nodes:
-            # If the node id matches itself then skip
-            if node.get("node_id") == self.node_id:
-                continue
-
-            # Otherwise create a connection to the XML RPC server for the other node
-            else:
-                self.other_nodes.append(xmlrpc.client.ServerProxy("http://" + node.get("address") + ":"
-                                                                  + str(node.get("port"))))
+        # Hand off the updates a member missed as soon as it comes back
+        self.membership.on_recover = self.handoff
+        # Start gossiping with the other nodes, the configured nodes are used as seeds to join the cluster
+        self.membership.start()
+        # Sync the data from a snapshot of one of the other nodes in the background
+        threading.Thread(target=self.state_transfer.sync,
+                         args=(self.data, self.membership, self.invalidation_log,)).start()
 
     # Put method for the key node's key/value store
     def put(self, key, value):
-        # Set the key and value for the dictionary from the passed arguments
-        self.data[key] = value
-        # Create a new worker thread to send out the updates to the other nodes
-        t = threading.Thread(target=update_others_eventual, args=(self.other_nodes, key, value,))
-        # Start the thread in the background of the node
-        t.start()
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing keep the put so it is applied again after the snapshot has been loaded
+            self.state_transfer.hold(("PUT", key, value,))
+            # Set the key and value for the dictionary from the passed arguments
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
+            # Create a new worker thread to send out the updates to the other nodes
+            t = threading.Thread(target=update_others_eventual, args=(self.membership, key, value,))
+            # Start the thread in the background of the node
+            t.start()
+            # Keep track of the thread so a shutdown can wait for it
+            self.track_worker(t)
 
-        if self.verbose:
-            print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Get and return the value by passing the key to the node
     def get(self, key):
         if self.verbose:
             print("Node {} GET -> Key {}".format(self.node_id, key))
-        # If the value does exist then return it
-        if self.data.get(key):
-            return self.data.get(key)
+        # Wait for the sync so a key that has not been loaded yet is not reported missing
+        self.state_transfer.synced.wait()
+        # Read once, a remove on another thread could drop the key between two reads
+        value = self.data.get(key)
+        # If the value does exist then return it, a large value is only described
+        if value:
+            return reply_value(value)
         # Else return null value because there is nothing
         else:
             return "NULL"
 
     # Remove the value by key from the node
     def remove(self, key):
-        if self.verbose:
-            print("Node {} Remove! -> Key {}".format(self.node_id, key))
-        # If the key exists
-        if self.data.get(key):
-            # Start a new background worker thread to remove the keys from the other nodes
-            t = threading.Thread(target=update_remove_eventual, args=(self.other_nodes, key,))
-            # Start the worker thread
-            t.start()
-            # Return the value after popping
-            return self.data.pop(key)
-        # Else return null because the value does not exist
-        else:
-            return "NULL"
+        # Wait for the sync so removing a key that has not been loaded yet is not lost
+        self.state_transfer.synced.wait()
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            if self.verbose:
+                print("Node {} Remove! -> Key {}".format(self.node_id, key))
+            # If the key exists
+            if self.data.get(key):
+                # While syncing keep the remove so it is applied again after the snapshot has been loaded
+                self.state_transfer.hold(("REMOVE", key,))
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+                # Start a new background worker thread to remove the keys from the other nodes
+                t = threading.Thread(target=update_remove_eventual, args=(self.membership, key,))
+                # Start the worker thread
+                t.start()
+                # Keep track of the thread so a shutdown can wait for it
+                self.track_worker(t)
+                # Return the value after popping
+                return reply_value(self.data.pop(key))
+            # Else return null because the value does not exist
+            else:
+                return "NULL"
 
     # Used for updates from other nodes to update the key, value pair
     def update(self, key, value):
-        # set the specified key to the value
-        self.data[key] = value
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the update, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("PUT", key, value,)):
+                return
+            # set the specified key to the value
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
 
-        if self.verbose:
-            print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Used for removals from other nodes
     def update_remove(self, key):
-        # Pop the key/value from the in memory dictionary
-        if self.data.get(key):
-            self.data.pop(key)
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the removal, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("REMOVE", key,)):
+                return
+            # Pop the key/value from the in memory dictionary
+            if self.data.get(key):
+                self.data.pop(key)
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+            if self.verbose:
+                print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+
+    # Used for gossip from other nodes, merge their member table and answer with this one
+    def gossip(self, members):
+        self.membership.merge(members)
+        return self.membership.table()
+
+    # Compare and set, set the key to new only if its value is expected, "NULL" expects the key to be missing
+    def cas(self, key, expected, new):
+        return self.atomic("CAS", key, [expected, new])
+
+    # Add delta to the integer value of a key, a missing key counts as 0, returns the new value
+    def incr(self, key, delta):
+        return self.atomic("INCR", key, [delta])
+
+    # Put only if the key is missing, returns True if the value was put
+    def put_if_absent(self, key, value):
+        return self.atomic("PUT_IF_ABSENT", key, [value])
+
+    # Run an atomic operation on the node that owns the key so operations on the same key never race
+    def atomic(self, op, key, args):
+        return forward_atomic(self, op, key, args)
+
+    # Used by the other nodes to run an atomic operation on this node as the owner of the key
+    # Returns before the result is replicated, a result that has not reached the other nodes is lost if this node fails
+    def apply_atomic(self, op, key, args):
+        # Wait for the sync so the operation does not run on a half loaded store
+        self.state_transfer.synced.wait()
+        with self.lock:
+            return apply_atomic_op(self, op, key, args)
+
+    # Put the result of an atomic operation
+    # It is replicated with a version because the update threads can reach the other nodes out of order
+    def atomic_put(self, key, value):
+        with self.lock:
+            # While syncing keep the put so it is applied again after the snapshot has been loaded
+            self.state_transfer.hold(("PUT", key, value,))
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
+            # Version from the owner's clock, always higher than the last one for the key
+            version = max(time.time(), self.versions.get(key, 0) + 0.000001)
+            self.versions[key] = version
+            # Create a new worker thread to send out the versioned update to the other nodes
+            t = threading.Thread(target=update_others_eventual, args=(self.membership, key, value, version,))
+            t.start()
+            # Keep track of the thread so a shutdown can wait for it
+            self.track_worker(t)
+
+            if self.verbose:
+                print("Node {} Atomic -> Key {}, Value {}".format(self.node_id, key, value))
+
+    # Used for atomic operation results from the owner of the key, older versions are ignored
+    def update_versioned(self, key, value, version):
+        with self.lock:
+            if version <= self.versions.get(key, 0):
+                return
+            self.versions[key] = version
+            self.update(key, value)
+
+    # Used by clients and other nodes to upload a chunk of a large value
+    def upload_chunk(self, key, upload_id, index, data):
+        self.uploads.add(upload_id, index, data)
+
+    # Put a large value once all of its chunks have been uploaded, it is kept compressed as it was sent
+    def put_upload(self, key, upload_id, codec):
+        return self.put(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+
+    # Used for large value updates from other nodes once all of the chunks have been uploaded
+    def update_upload(self, key, upload_id, codec):
+        return self.update(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+
+    # Get a chunk of a large value, NULL when the value has changed since the client read its description
+    def get_chunk(self, key, blob_id, offset):
+        value = self.data.get(key)
+        if not isinstance(value, Blob) or value.blob_id != blob_id:
+            return "NULL"
+        return xmlrpc.client.Binary(value.data[offset:offset + cfg.value_chunk_size])
+
+    # Used by a new or restarted node to stream a snapshot of this node's data in chunks
+    def snapshot_chunk(self, snapshot_id, offset):
+        return self.state_transfer.snapshot_chunk(self.data, snapshot_id, offset)
+
+    # Used by cached clients to find out which keys changed since the last change they saw
+    def invalidations(self, epoch, seq):
+        return self.invalidation_log.since(epoch, seq)
+
+    # Get the node ids of the members this node currently sees as alive, including itself
+    def members(self):
+        return [self.node_id] + [node_id for node_id, _ in self.membership.peers()]
+
+    # Start sending the updates a member missed while it was failed, called by the membership when it comes back
+    def handoff(self, node_id):
+        t = threading.Thread(target=handoff_eventual, args=(self.membership, node_id,))
+        t.start()
+        # Keep track of the thread so a flush waits for it
+        self.track_worker(t)
+
+    # Keep a worker thread in the list and drop the ones that have already finished
+    def track_worker(self, t):
+        self.workers = [w for w in self.workers if w.is_alive()]
+        self.workers.append(t)
+
+    # Block until every pending update has been sent to the other nodes
+    def flush(self):
+        # Join each of the worker threads that are still sending updates
+        while self.workers:
+            self.workers.pop().join()
+
+        if self.verbose:
+            print("Node {} Flushed!".format(self.node_id))
+
+        return True
+
+    # Flush the pending updates and then signal the node to stop
+    def shutdown(self):
+        self.flush()
+        # Leave the cluster so the other nodes stop replicating to this one
+        self.membership.leave()
+        # Let the server listener thread know it can stop
+        self.shutdown_event.set()
+
         if self.verbose:
-            print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+            print("Node {} Shutdown!".format(self.node_id))
+
+        return True
 
 
 # Static method to update the other nodes after getting a new put
-def update_others_eventual(other_nodes, key, value):
-    # For each nodes in the other_nodes array
-    for node in other_nodes:
-        # This loop will keep trying to update even with errors
-        while True:
+# The version is only set for atomic operation results
+def update_others_eventual(membership, key, value, version=None):
+    if version is not None:
+        update_eventual(membership, ("VERSIONED", key, value, version,))
+    else:
+        update_eventual(membership, ("PUT", key, value,))
+
+
+# Static method to remove the other nodes after getting a new put
+def update_remove_eventual(membership, key):
+    update_eventual(membership, ("REMOVE", key,))
+
+
+# Static method to send one update to every other node, a node that is failed gets it handed off when it comes back
+def update_eventual(membership, update_value):
+    # For each of the other nodes that have not left
+    for node_id, node in membership.replicas():
+        # This loop will keep trying to update even with errors until the node is detected as failed
+        while membership.is_alive(node_id):
             # Create an artificial delay to mimic actual distribution
             delay = random.uniform(0.2, 1)
             # Sleep the thread for the delayed time
             time.sleep(delay)
             # Try to update the other node
             try:
-                # Update the other node
-                node.update(key, value)
+                send_update_eventual(node, update_value)
                 # Break the while look
                 break
             # When there is an error updating the key, value in the other node
             except:
                 # Tell the loop to continue and try value again
                 continue
+        # The node is failed, keep the update for when it comes back
+        else:
+            membership.hint(node_id, [update_value])
 
 
-# Static method to remove the other nodes after getting a new put
-def update_remove_eventual(other_nodes, key):
-    # For each nodes in the other_nodes array
-    for node in other_nodes:
-        # This loop will keep trying to update even with errors
-        while True:
-            # Create an artificial delay to mimic actual distribution
-            delay = random.uniform(0.2, 1)
-            # Sleep the thread for the delayed time
-            time.sleep(delay)
-            # Try to update the other node
+# Static method to send the updates a node missed while it was failed, once it is back
+def handoff_eventual(membership, node_id):
+    node = membership.connection(node_id, cfg.rpc_timeout)
+    hints = membership.take_hints(node_id)
+    for i, update_value in enumerate(hints):
+        while membership.is_alive(node_id):
             try:
-                # Update the other node
-                node.update_remove(key)
-                # Break the while look
+                send_update_eventual(node, update_value)
                 break
-            # When there is an error updating the key, value in the other node
             except:
-                # Tell the loop to continue and try value again
+                time.sleep(cfg.retry_delay)
                 continue
+        # The node failed again, keep the rest for the next time it comes back
+        else:
+            membership.hint(node_id, hints[i:])
+            return
+
+
+# Static method to send one update to another node in eventual mode
+def send_update_eventual(node, update_value):
+    if update_value[0] == "REMOVE":
+        node.update_remove(update_value[1])
+    # Atomic operation results are sent with their version
+    elif update_value[0] == "VERSIONED":
+        node.update_versioned(update_value[1], update_value[2], update_value[3])
+    # Large values are sent in chunks as they are
+    elif isinstance(update_value[2], Blob):
+        send_blob(node, "update_upload", update_value[1], update_value[2])
+    else:
+        node.update(update_value[1], update_value[2])
+
+
+# Static method to run an atomic operation on the node that owns the key
+def forward_atomic(node, op, key, args):
+    while True:
+        owner = node.membership.owner(key)
+        if owner == node.node_id:
+            return node.apply_atomic(op, key, args)
+        # Forward to the owner without a timeout, giving up after it was sent could apply the operation twice
+        try:
+            return node.membership.connection(owner).apply_atomic(op, key, args)
+        # The owner is down but has not reached the failure timeout yet, nothing was sent so pick the owner again
+        except ConnectionRefusedError:
+            node.membership.suspect(owner)
+            time.sleep(cfg.retry_delay)
+
+
+# Static method to run an atomic operation on a node's data, the caller holds the node's lock
+def apply_atomic_op(node, op, key, args):
+    # Current value, None when the key is missing
+    current = node.data.get(key)
+    if op == "CAS":
+        expected, new = args
+        # Only set when the current value is the expected one
+        if (current if current else "NULL") != expected:
+            return False
+        node.atomic_put(key, new)
+        return True
+    elif op == "INCR":
+        # Missing keys start at 0, the value is kept as a string like every other value
+        value = int(current if current else 0) + args[0]
+        # Refuse before putting, a result XML RPC can not send back would still have been applied
+        if not xmlrpc.client.MININT <= value <= xmlrpc.client.MAXINT:
+            raise OverflowError("Incrementing key {} to {} is out of range".format(key, value))
+        node.atomic_put(key, str(value))
+        return value
+    elif op == "PUT_IF_ABSENT":
+        # Only put when the key is missing
+        if current:
+            return False
+        node.atomic_put(key, args[0])
+        return True
+
+
+# Static method to send a batch of updates to another node, small updates go in one call and large values in chunks
+# Returns True only if the node acknowledged every call
+def send_updates(node, updates):
+    acknowledged = True
+    small = []
+    for update_value in updates:
+        if update_value[0] == "PUT" and isinstance(update_value[2], Blob):
+            # Send the small updates before the large value so the order stays the same
+            if small:
+                if not node.update_batch(small):
+                    acknowledged = False
+                small = []
+            if not send_blob(node, "update_upload", update_value[1], update_value[2]):
+                acknowledged = False
+        else:
+            small.append(update_value)
+    if small:
+        if not node.update_batch(small):
+            acknowledged = False
+    return acknowledged
 
 
 # Class functionality for eventual sequential kv
 # Running everything in an instance will allow instance variables and running everything in-memory
 class SequentialNode:
-    def __init__(self, address, port, node_id, verbose):
+    def __init__(self, address, port, node_id, verbose, shard=None):
         # Set the address
         self.address = address
         # Set the port
@@ -189,114 +558,283 @@ class SequentialNode:
         self.node_id = node_id
         # This is what is going to be the node's Key/Value store in memory
         self.data = {}
-        # This will store a list of the other nodes running
-        self.other_nodes = []
+        # Membership of the cluster, keeps track of which other nodes are running
+        self.membership = Membership(address, port, node_id, verbose, shard)
+        # Snapshots for other nodes and the writes buffered while this node syncs
+        self.state_transfer = StateTransfer(node_id, verbose)
+        # Keys changed by puts and removes, for clients that cache what they read
+        self.invalidation_log = InvalidationLog()
+        # Chunks of large values that are still being uploaded
+        self.uploads = Uploads()
+        # Lock for changing the data, reentrant because atomic operations put while holding it
+        self.lock = threading.RLock()
         # Queue of the keys and values that will have to be updated
         self.update_queue = queue.Queue()
+        # Set when the node has been told to shut down
+        self.shutdown_event = threading.Event()
         # Verbose logging option for more data to be printed
         self.verbose = verbose
 
-        # Create connections to the other nodes but skip self
-        for node in cfg.nodes:
-            # If the node id matches itself then skip
-            if node.get("node_id") == self.node_id:
-                continue
-
-            # Otherwise create a connection to the XML RPC server for the other node
-            else:
-                self.other_nodes.append(xmlrpc.client.ServerProxy("http://" + node.get("address") + ":"
-                                                                  + str(node.get("port"))))
+        # Hand off the updates a member missed as soon as it comes back
+        self.membership.on_recover = self.handoff
+        # Start gossiping with the other nodes, the configured nodes are used as seeds to join the cluster
+        self.membership.start()
+        # Sync the data from a snapshot of one of the other nodes in the background
+        threading.Thread(target=self.state_transfer.sync,
+                         args=(self.data, self.membership, self.invalidation_log,)).start()
 
         # Create and start the worker thread to update the other nodes
-        threading.Thread(target=update_sequential, args=(self.other_nodes, self.update_queue,)).start()
+        self.worker = threading.Thread(target=update_sequential,
+                                       args=(self.membership, self.update_queue, cfg.update_linger,
+                                             cfg.update_batch_size,))
+        self.worker.start()
 
     # Put method for the key node's key/value store
     def put(self, key, value):
-        # Set the key and value for the dictionary from the passed arguments
-        self.data[key] = value
-        # Add the new put value to the queue to update other nodes
-        self.update_queue.put("PUT" + ":" + key + ":" + value)
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing keep the put so it is applied again after the snapshot has been loaded
+            self.state_transfer.hold(("PUT", key, value,))
+            # Set the key and value for the dictionary from the passed arguments
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
+            # Add the new put value to the queue to update other nodes
+            self.update_queue.put(("PUT", key, value,))
 
-        if self.verbose:
-            print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Get and return the value by passing the key to the node
     def get(self, key):
         if self.verbose:
             print("Node {} GET -> Key {}".format(self.node_id, key))
-        # If the value does exist then return it
-        if self.data.get(key):
-            return self.data.get(key)
+        # Wait for the sync so a key that has not been loaded yet is not reported missing
+        self.state_transfer.synced.wait()
+        # Read once, a remove on another thread could drop the key between two reads
+        value = self.data.get(key)
+        # If the value does exist then return it, a large value is only described
+        if value:
+            return reply_value(value)
         # Else return null value because there is nothing
         else:
             return "NULL"
 
     # Remove the value by key from the node
     def remove(self, key):
-        if self.verbose:
-            print("Node {} Remove! -> Key {}".format(self.node_id, key))
-        # If the value exists
-        if self.data.get(key):
-            self.update_queue.put("REMOVE" + ":" + key)
-            # Return the value and pop it from the dictionary
-            return self.data.pop(key)
-        # Else return null when nothing happens because the value does not exist
-        else:
-            return "NULL"
+        # Wait for the sync so removing a key that has not been loaded yet is not lost
+        self.state_transfer.synced.wait()
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            if self.verbose:
+                print("Node {} Remove! -> Key {}".format(self.node_id, key))
+            # If the value exists
+            if self.data.get(key):
+                # While syncing keep the remove so it is applied again after the snapshot has been loaded
+                self.state_transfer.hold(("REMOVE", key,))
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+                self.update_queue.put(("REMOVE", key,))
+                # Return the value and pop it from the dictionary
+                return reply_value(self.data.pop(key))
+            # Else return null when nothing happens because the value does not exist
+            else:
+                return "NULL"
 
     # Used for updates from other nodes to update the key, value pair
     def update(self, key, value):
-        # set the specified key to the value
-        self.data[key] = value
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the update, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("PUT", key, value,)):
+                return
+            # set the specified key to the value
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
 
-        if self.verbose:
-            print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Used for removals from other nodes
     def update_remove(self, key):
-        # Pop the key/value from the in memory dictionary
-        if self.data.get(key):
-            self.data.pop(key)
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the removal, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("REMOVE", key,)):
+                return
+            # Pop the key/value from the in memory dictionary
+            if self.data.get(key):
+                self.data.pop(key)
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+            if self.verbose:
+                print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+
+    # Used for gossip from other nodes, merge their member table and answer with this one
+    def gossip(self, members):
+        self.membership.merge(members)
+        return self.membership.table()
+
+    # Compare and set, set the key to new only if its value is expected, "NULL" expects the key to be missing
+    def cas(self, key, expected, new):
+        return self.atomic("CAS", key, [expected, new])
+
+    # Add delta to the integer value of a key, a missing key counts as 0, returns the new value
+    def incr(self, key, delta):
+        return self.atomic("INCR", key, [delta])
+
+    # Put only if the key is missing, returns True if the value was put
+    def put_if_absent(self, key, value):
+        return self.atomic("PUT_IF_ABSENT", key, [value])
+
+    # Run an atomic operation on the node that owns the key so operations on the same key never race
+    def atomic(self, op, key, args):
+        return forward_atomic(self, op, key, args)
+
+    # Used by the other nodes to run an atomic operation on this node as the owner of the key
+    def apply_atomic(self, op, key, args):
+        # Wait for the sync so the operation does not run on a half loaded store
+        self.state_transfer.synced.wait()
+        replicated = threading.Event()
+        with self.lock:
+            # Once the worker has been told to exit nothing would ever wait for the change to reach the other nodes
+            if self.shutdown_event.is_set():
+                raise RuntimeError("Node {} is shutting down".format(self.node_id))
+            result = apply_atomic_op(self, op, key, args)
+            # Queued under the lock so it always comes before the shutdown in the queue
+            self.update_queue.put(("SYNC", replicated,))
+        # Wait for the change to reach the other nodes so the result is not lost if this node fails right after
+        replicated.wait()
+        return result
+
+    # Put the result of an atomic operation, the update queue already keeps the results in order
+    def atomic_put(self, key, value):
+        self.put(key, value)
+
+    # Used by clients and other nodes to upload a chunk of a large value
+    def upload_chunk(self, key, upload_id, index, data):
+        self.uploads.add(upload_id, index, data)
+
+    # Put a large value once all of its chunks have been uploaded, it is kept compressed as it was sent
+    def put_upload(self, key, upload_id, codec):
+        return self.put(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+
+    # Used for large value updates from other nodes once all of the chunks have been uploaded
+    def update_upload(self, key, upload_id, codec):
+        self.update(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+        # Acknowledge that the large value has been applied
+        return True
+
+    # Get a chunk of a large value, NULL when the value has changed since the client read its description
+    def get_chunk(self, key, blob_id, offset):
+        value = self.data.get(key)
+        if not isinstance(value, Blob) or value.blob_id != blob_id:
+            return "NULL"
+        return xmlrpc.client.Binary(value.data[offset:offset + cfg.value_chunk_size])
+
+    # Used by a new or restarted node to stream a snapshot of this node's data in chunks
+    def snapshot_chunk(self, snapshot_id, offset):
+        return self.state_transfer.snapshot_chunk(self.data, snapshot_id, offset)
+
+    # Used by cached clients to find out which keys changed since the last change they saw
+    def invalidations(self, epoch, seq):
+        return self.invalidation_log.since(epoch, seq)
+
+    # Get the node ids of the members this node currently sees as alive, including itself
+    def members(self):
+        return [self.node_id] + [node_id for node_id, _ in self.membership.peers()]
+
+    # Used for a batch of updates and removals from other nodes, applied in order
+    def update_batch(self, updates):
+        # For each of the updates in the batch
+        for update_value in updates:
+            if update_value[0] == "PUT":
+                self.update(update_value[1], update_value[2])
+            elif update_value[0] == "REMOVE":
+                self.update_remove(update_value[1])
+        # Acknowledge that the whole batch has been applied
+        return True
+
+    # Wake up the worker to send the updates a member missed while it was failed, called when it comes back
+    def handoff(self, node_id):
+        self.update_queue.put(("HANDOFF", node_id,))
+
+    # Block until every pending update in the queue has been sent to the other nodes
+    def flush(self):
+        # The worker marks each update as done once all the other nodes have it
+        self.update_queue.join()
+
+        if self.verbose:
+            print("Node {} Flushed!".format(self.node_id))
+
+        return True
+
+    # Flush the pending updates and then signal the node and its worker to stop
+    def shutdown(self):
+        self.flush()
+        # Leave the cluster so the other nodes stop replicating to this one
+        self.membership.leave()
+        # Under the lock so no atomic operation queues its wait after the worker has been told to exit
+        with self.lock:
+            # None in the queue tells the worker thread to exit
+            self.update_queue.put(None)
+            # Let the server listener thread know it can stop
+            self.shutdown_event.set()
+
         if self.verbose:
-            print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+            print("Node {} Shutdown!".format(self.node_id))
+
+        return True
 
 
 # Static worker thread to update the other nodes from a queue
-def update_sequential(other_nodes, update_queue):
-    # While loop to run continuously as a background worker for the update queue
-    while True:
-        # Create an artificial delay to mimic actual distribution
-        delay = random.uniform(0.2, 1)
-        # Sleep the thread for the delayed time
-        time.sleep(delay)
-        # Only run update when the queue is not empty
-        if update_queue.empty() is False:
-            # Get the value from the queue to update, in order FIFO of course
-            update_value = update_queue.get()
-            # For each of the other nodes
-            for node in other_nodes:
-                # While loop to keep trying until update succeeds
-                while True:
-                    # Try
-                    try:
-                        # Split the queue values back into key-val
-                        key_val = update_value.split(":")
-                        if key_val[0] == "PUT":
-                            # Update with the key value pair with the other node
-                            node.update(key_val[1], key_val[2])
-                        elif key_val[0] == "REMOVE":
-                            node.update_remove(key_val[1])
-                        # Break the sub-while loop to go back to the other
-                        break
-                    # If there is some issue updating, try again
-                    except:
-                        continue
+def update_sequential(membership, update_queue, linger, batch_size):
+    # Run as a background worker for the update queue until the shutdown signal comes through
+    running = True
+    while running:
+        # Block on the queue for the next batch of updates, in order FIFO of course
+        batch = next_update_batch(update_queue, linger, batch_size)
+        # None at the end of the batch is the shutdown signal, everything before it is still sent
+        if batch[-1] is None:
+            running = False
+        # SYNC values only wait for the updates before them to be sent, they are not sent themselves
+        # HANDOFF values only wake the worker up to send the hints of a member that came back
+        updates = [update_value for update_value in batch
+                   if update_value is not None and update_value[0] not in ["SYNC", "HANDOFF"]]
+        # For each of the other nodes that have not left
+        for node_id, node in membership.replicas():
+            # The updates the node missed while it was failed go first so it gets everything in order
+            pending = membership.take_hints(node_id) + updates
+            # Only send when there is something to update
+            if not pending:
+                continue
+            # While loop to keep trying until update succeeds or the node is detected as failed
+            while membership.is_alive(node_id):
+                # Try
+                try:
+                    # Send the whole batch
+                    send_updates(node, pending)
+                    # Break the sub-while loop to go back to the other
+                    break
+                # If there is some issue updating, wait a moment and try again
+                except:
+                    time.sleep(cfg.retry_delay)
+                    continue
+            # The node is failed, keep the updates for when it comes back
+            else:
+                membership.hint(node_id, pending)
+        # Mark every value taken from the queue as done so flush can return, and wake up whoever waits on a SYNC
+        for update_value in batch:
+            if update_value is not None and update_value[0] == "SYNC":
+                update_value[1].set()
+            update_queue.task_done()
 
 
 # Class functionality for eventual linearizable kv
 # Running everything in an instance will allow instance variables and running everything in-memory
 class LinearizableNode:
-    def __init__(self, address, port, node_id, verbose):
+    def __init__(self, address, port, node_id, verbose, shard=None):
         # Set the address
         self.address = address
         # Set the port
@@ -305,109 +843,275 @@ class LinearizableNode:
         self.node_id = node_id
         # This is what is going to be the node's Key/Value store in memory
         self.data = {}
-        # This will store a list of the other nodes running
-        self.other_nodes = []
+        # Membership of the cluster, keeps track of which other nodes are running
+        self.membership = Membership(address, port, node_id, verbose, shard)
+        # Snapshots for other nodes and the writes buffered while this node syncs
+        self.state_transfer = StateTransfer(node_id, verbose)
+        # Keys changed by puts and removes, for clients that cache what they read
+        self.invalidation_log = InvalidationLog()
+        # Chunks of large values that are still being uploaded
+        self.uploads = Uploads()
+        # Lock for changing the data, reentrant because atomic operations put while holding it
+        self.lock = threading.RLock()
         # Queue of the keys and values that will have to be updated
         self.update_queue = queue.Queue()
+        # Set when the node has been told to shut down
+        self.shutdown_event = threading.Event()
         # Verbose logging option for more data to be printed
         self.verbose = verbose
 
-        # Create connections to the other nodes but skip self
-        for node in cfg.nodes:
-            # If the node id matches itself then skip
-            if node.get("node_id") == self.node_id:
-                continue
-
-            # Otherwise create a connection to the XML RPC server for the other node
-            else:
-                self.other_nodes.append(xmlrpc.client.ServerProxy("http://" + node.get("address") + ":"
-                                                                  + str(node.get("port"))))
+        # Hand off the updates a member missed as soon as it comes back
+        self.membership.on_recover = self.handoff
+        # Start gossiping with the other nodes, the configured nodes are used as seeds to join the cluster
+        self.membership.start()
+        # Sync the data from a snapshot of one of the other nodes in the background
+        threading.Thread(target=self.state_transfer.sync,
+                         args=(self.data, self.membership, self.invalidation_log,)).start()
 
         # Create and start the worker thread to update the other nodes
-        threading.Thread(target=update_linearizable, args=(self.other_nodes, self.update_queue,)).start()
+        self.worker = threading.Thread(target=update_linearizable,
+                                       args=(self.membership, self.update_queue, cfg.update_linger,
+                                             cfg.update_batch_size,))
+        self.worker.start()
 
     # Put method for the key node's key/value store
     def put(self, key, value):
-        # Set the key and value for the dictionary from the passed arguments
-        self.data[key] = value
-        # Add the new put value to the queue to update other nodes
-        self.update_queue.put("PUT" + ":" + key + ":" + value)
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing keep the put so it is applied again after the snapshot has been loaded
+            self.state_transfer.hold(("PUT", key, value,))
+            # Set the key and value for the dictionary from the passed arguments
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
+            # Add the new put value to the queue to update other nodes
+            self.update_queue.put(("PUT", key, value,))
 
-        if self.verbose:
-            print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Get and return the value by passing the key to the node
     def get(self, key):
         if self.verbose:
             print("Node {} GET -> Key {}".format(self.node_id, key))
-        # If the value does exist then return it
-        if self.data.get(key):
-            return self.data.get(key)
+        # Wait for the sync so a key that has not been loaded yet is not reported missing
+        self.state_transfer.synced.wait()
+        # Read once, a remove on another thread could drop the key between two reads
+        value = self.data.get(key)
+        # If the value does exist then return it, a large value is only described
+        if value:
+            return reply_value(value)
         # Else return null value because there is nothing
         else:
             return "NULL"
 
     # Remove the value by key from the node
     def remove(self, key):
-        if self.verbose:
-            print("Node {} Remove! -> Key {}".format(self.node_id, key))
-        # If the value exists
-        if self.data.get(key):
-            self.update_queue.put("REMOVE" + ":" + key)
-            # Return the value and pop it from the dictionary
-            return self.data.pop(key)
-        # Else return null when nothing happens because the value does not exist
-        else:
-            return "NULL"
+        # Wait for the sync so removing a key that has not been loaded yet is not lost
+        self.state_transfer.synced.wait()
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            if self.verbose:
+                print("Node {} Remove! -> Key {}".format(self.node_id, key))
+            # If the value exists
+            if self.data.get(key):
+                # While syncing keep the remove so it is applied again after the snapshot has been loaded
+                self.state_transfer.hold(("REMOVE", key,))
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+                self.update_queue.put(("REMOVE", key,))
+                # Return the value and pop it from the dictionary
+                return reply_value(self.data.pop(key))
+            # Else return null when nothing happens because the value does not exist
+            else:
+                return "NULL"
 
     # Used for updates from other nodes to update the key, value pair
     def update(self, key, value):
-        # set the specified key to the value
-        self.data[key] = value
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the update, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("PUT", key, value,)):
+                return
+            # set the specified key to the value
+            self.data[key] = value
+            # Let cached clients know the key changed
+            self.invalidation_log.record(key)
 
-        if self.verbose:
-            print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
+            if self.verbose:
+                print("Node {} Updated! -> Key {}, Value {}".format(self.node_id, key, value))
 
     # Used for removals from other nodes
     def update_remove(self, key):
-        # Pop the key/value from the in memory dictionary
-        if self.data.get(key):
-            self.data.pop(key)
+        # Lock so an atomic operation never runs in the middle of this one
+        with self.lock:
+            # While syncing buffer the removal, it is applied after the snapshot has been loaded
+            if self.state_transfer.hold(("REMOVE", key,)):
+                return
+            # Pop the key/value from the in memory dictionary
+            if self.data.get(key):
+                self.data.pop(key)
+                # Let cached clients know the key changed
+                self.invalidation_log.record(key)
+            if self.verbose:
+                print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+
+    # Used for gossip from other nodes, merge their member table and answer with this one
+    def gossip(self, members):
+        self.membership.merge(members)
+        return self.membership.table()
+
+    # Compare and set, set the key to new only if its value is expected, "NULL" expects the key to be missing
+    def cas(self, key, expected, new):
+        return self.atomic("CAS", key, [expected, new])
+
+    # Add delta to the integer value of a key, a missing key counts as 0, returns the new value
+    def incr(self, key, delta):
+        return self.atomic("INCR", key, [delta])
+
+    # Put only if the key is missing, returns True if the value was put
+    def put_if_absent(self, key, value):
+        return self.atomic("PUT_IF_ABSENT", key, [value])
+
+    # Run an atomic operation on the node that owns the key so operations on the same key never race
+    def atomic(self, op, key, args):
+        return forward_atomic(self, op, key, args)
+
+    # Used by the other nodes to run an atomic operation on this node as the owner of the key
+    def apply_atomic(self, op, key, args):
+        # Wait for the sync so the operation does not run on a half loaded store
+        self.state_transfer.synced.wait()
+        replicated = threading.Event()
+        with self.lock:
+            # Once the worker has been told to exit nothing would ever wait for the change to reach the other nodes
+            if self.shutdown_event.is_set():
+                raise RuntimeError("Node {} is shutting down".format(self.node_id))
+            result = apply_atomic_op(self, op, key, args)
+            # Queued under the lock so it always comes before the shutdown in the queue
+            self.update_queue.put(("SYNC", replicated,))
+        # Wait for the change to reach the other nodes so every node reads it once the call returns
+        replicated.wait()
+        return result
+
+    # Put the result of an atomic operation, the update queue already keeps the results in order
+    def atomic_put(self, key, value):
+        self.put(key, value)
+
+    # Used by clients and other nodes to upload a chunk of a large value
+    def upload_chunk(self, key, upload_id, index, data):
+        self.uploads.add(upload_id, index, data)
+
+    # Put a large value once all of its chunks have been uploaded, it is kept compressed as it was sent
+    def put_upload(self, key, upload_id, codec):
+        return self.put(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+
+    # Used for large value updates from other nodes once all of the chunks have been uploaded
+    def update_upload(self, key, upload_id, codec):
+        self.update(key, Blob(upload_id, codec, self.uploads.take(upload_id)))
+        # Acknowledge that the large value has been applied
+        return True
+
+    # Get a chunk of a large value, NULL when the value has changed since the client read its description
+    def get_chunk(self, key, blob_id, offset):
+        value = self.data.get(key)
+        if not isinstance(value, Blob) or value.blob_id != blob_id:
+            return "NULL"
+        return xmlrpc.client.Binary(value.data[offset:offset + cfg.value_chunk_size])
+
+    # Used by a new or restarted node to stream a snapshot of this node's data in chunks
+    def snapshot_chunk(self, snapshot_id, offset):
+        return self.state_transfer.snapshot_chunk(self.data, snapshot_id, offset)
+
+    # Used by cached clients to find out which keys changed since the last change they saw
+    def invalidations(self, epoch, seq):
+        return self.invalidation_log.since(epoch, seq)
+
+    # Get the node ids of the members this node currently sees as alive, including itself
+    def members(self):
+        return [self.node_id] + [node_id for node_id, _ in self.membership.peers()]
+
+    # Used for a batch of updates and removals from other nodes, applied in order
+    def update_batch(self, updates):
+        # For each of the updates in the batch
+        for update_value in updates:
+            if update_value[0] == "PUT":
+                self.update(update_value[1], update_value[2])
+            elif update_value[0] == "REMOVE":
+                self.update_remove(update_value[1])
+        # Acknowledge that the whole batch has been applied
+        return True
+
+    # Wake up the worker to send the updates a member missed while it was failed, called when it comes back
+    def handoff(self, node_id):
+        self.update_queue.put(("HANDOFF", node_id,))
+
+    # Block until every pending update in the queue has been sent to the other nodes
+    def flush(self):
+        # The worker marks each update as done once all the other nodes have it
+        self.update_queue.join()
+
+        if self.verbose:
+            print("Node {} Flushed!".format(self.node_id))
+
+        return True
+
+    # Flush the pending updates and then signal the node and its worker to stop
+    def shutdown(self):
+        self.flush()
+        # Leave the cluster so the other nodes stop replicating to this one
+        self.membership.leave()
+        # Under the lock so no atomic operation queues its wait after the worker has been told to exit
+        with self.lock:
+            # None in the queue tells the worker thread to exit
+            self.update_queue.put(None)
+            # Let the server listener thread know it can stop
+            self.shutdown_event.set()
+
         if self.verbose:
-            print("Node {} Updated Remove! -> Key {}".format(self.node_id, key))
+            print("Node {} Shutdown!".format(self.node_id))
+
+        return True
 
 
 # Static worker thread to update the other nodes from a queue
-def update_linearizable(other_nodes, update_queue):
-    # While loop to run continuously as a background worker for the update queue
-    while True:
-        # Create an artificial delay to mimic actual distribution
-        delay = random.uniform(0.2, 1)
-        # Sleep the thread for the delayed time
-        time.sleep(delay)
-        # Only run update when the queue is not empty
-        if update_queue.empty() is False:
-            # Get the value from the queue to update, in order FIFO of course
-            update_value = update_queue.get()
-            # For each of the other nodes
-            for node in other_nodes:
-                # While loop to keep trying until update succeeds
-                while True:
-                    # Try
-                    try:
-                        # Split the queue values back into key-val
-                        key_val = update_value.split(":")
-                        if key_val[0] == "PUT":
-                            # Update with the key value pair with the other node
-                            node.update(key_val[1], key_val[2])
-                            # Verify that the value of the node has been properly updated then break to the next
-                            if node.get(key_val[1] == key_val[2]):
-                                break
-                        elif key_val[0] == "REMOVE":
-                            node.update_remove(key_val[1])
-                            # Verify that the value of the node has been properly removed then break to the next
-                            if node.get(key_val[1] == "NULL"):
-                                break
-                    # If there is some issue updating, try again
-                    except:
-                        continue
+def update_linearizable(membership, update_queue, linger, batch_size):
+    # Run as a background worker for the update queue until the shutdown signal comes through
+    running = True
+    while running:
+        # Block on the queue for the next batch of updates, in order FIFO of course
+        batch = next_update_batch(update_queue, linger, batch_size)
+        # None at the end of the batch is the shutdown signal, everything before it is still sent
+        if batch[-1] is None:
+            running = False
+        # SYNC values only wait for the updates before them to be sent, they are not sent themselves
+        # HANDOFF values only wake the worker up to send the hints of a member that came back
+        updates = [update_value for update_value in batch
+                   if update_value is not None and update_value[0] not in ["SYNC", "HANDOFF"]]
+        # For each of the other nodes that have not left
+        for node_id, node in membership.replicas():
+            # The updates the node missed while it was failed go first so it gets everything in order
+            pending = membership.take_hints(node_id) + updates
+            # Only send when there is something to update
+            if not pending:
+                continue
+            # While loop to keep trying until update succeeds or the node is detected as failed
+            while membership.is_alive(node_id):
+                # Try
+                try:
+                    # Send the whole batch and verify the node applied it then break to the next
+                    if send_updates(node, pending):
+                        break
+                    # The node did not acknowledge the batch, wait a moment and send it again
+                    time.sleep(cfg.retry_delay)
+                # If there is some issue updating, wait a moment and try again
+                except:
+                    time.sleep(cfg.retry_delay)
+                    continue
+            # The node is failed, keep the updates for when it comes back
+            else:
+                membership.hint(node_id, pending)
+        # Mark every value taken from the queue as done so flush can return, and wake up whoever waits on a SYNC
+        for update_value in batch:
+            if update_value is not None and update_value[0] == "SYNC":
+                update_value[1].set()
+            update_queue.task_done()
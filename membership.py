@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+# Import the configuration file for the nodes to find the seed nodes and gossip settings
+import nodes_config as cfg
+
+# Import the shard ports so a shard gossips with the same shard on the other nodes
+from sharding import shard_port
+
+# Import XML RPC client to gossip with the other nodes
+import xmlrpc.client
+
+# Import threading to run the gossip in the background and lock the member table
+import threading
+
+# Import time for heartbeats and failure detection, random to pick who to gossip with
+import time
+import random
+
+# Import zlib for a hash of the key that is the same on every node
+import zlib
+
+"""
+Gossip based cluster membership for the kv nodes.
+Each node keeps a table of the members it knows about with a heartbeat counter. Every gossip interval a node bumps
+its own heartbeat and swaps tables with a few random members, keeping the higher heartbeat for each entry.
+A member whose heartbeat has not gone up within the failure timeout is considered failed and is skipped for
+replication until a newer heartbeat shows up again. The updates a failed member missed are kept as hints and handed
+off to it once it comes back under the same incarnation, a restarted member syncs from a snapshot instead.
+"""
+
+
+# Transport for the XML RPC client with a socket timeout so a hung node can not block the caller forever
+class TimeoutTransport(xmlrpc.client.Transport):
+    def __init__(self, timeout):
+        super().__init__()
+        # Set the timeout in seconds
+        self.timeout = timeout
+
+    # Create the HTTP connection and set the timeout on it
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        return connection
+
+
+# Create a connection to the XML RPC server of a node, with the configured timeout unless another one is given
+def connect(address, port, timeout=cfg.rpc_timeout):
+    return xmlrpc.client.ServerProxy("http://" + address + ":" + str(port),
+                                     transport=TimeoutTransport(timeout), allow_none=True)
+
+
+# Class for the member table of a single node and the gossip worker that keeps it up to date
+class Membership:
+    def __init__(self, address, port, node_id, verbose, shard=None):
+        # Set the address
+        self.address = address
+        # Set the port
+        self.port = port
+        # Set the node id
+        self.node_id = node_id
+        # Verbose logging option for more data to be printed
+        self.verbose = verbose
+        # Incarnation so a restarted node wins over the heartbeats from its previous run
+        self.incarnation = time.time()
+        # Table of the members keyed by node id, including this node
+        self.members = {}
+        # Local time each member's heartbeat last went up, used for failure detection
+        self.last_updated = {}
+        # Lock for the tables because the gossip worker and the XML RPC server both change them
+        self.lock = threading.Lock()
+        # Set when the gossip worker should stop
+        self.stop_event = threading.Event()
+        # Updates each member missed while it was failed, in order, keyed by node id
+        self.hints = {}
+        # Lock for the hints because every replication thread adds to them
+        self.hints_lock = threading.Lock()
+        # Called with the node id of a member that came back under the same incarnation so its hints can be sent
+        self.on_recover = None
+
+        # Add this node to the table
+        self.members[node_id] = {"node_id": node_id, "address": address, "port": port,
+                                 "incarnation": self.incarnation, "heartbeat": 0, "status": "alive"}
+        self.last_updated[node_id] = time.monotonic()
+
+        # Add the configured nodes as seeds, they count as alive until the failure timeout says otherwise
+        for node in cfg.nodes:
+            # If the node id matches itself then skip
+            if node.get("node_id") == self.node_id:
+                continue
+            # A shard only talks to the same shard on the other nodes
+            seed_port = node.get("port") if shard is None else shard_port(node.get("port"), shard)
+            self.members[node.get("node_id")] = {"node_id": node.get("node_id"), "address": node.get("address"),
+                                                 "port": seed_port, "incarnation": 0, "heartbeat": 0,
+                                                 "status": "alive"}
+            self.last_updated[node.get("node_id")] = time.monotonic()
+
+    # Start the gossip worker thread in the background
+    def start(self):
+        threading.Thread(target=gossip_worker, args=(self,)).start()
+
+    # Check if a member is alive: not left and its heartbeat went up within the failure timeout
+    def is_alive(self, node_id):
+        with self.lock:
+            member = self.members.get(node_id)
+            if member is None or member.get("status") != "alive":
+                return False
+            return time.monotonic() - self.last_updated[node_id] < cfg.failure_timeout
+
+    # Get new connections to the other members that are currently alive as a list of (node id, connection)
+    # Every caller gets its own connections because an XML RPC connection can not be shared between threads
+    def peers(self):
+        peers = []
+        for node_id, member in list(self.members.items()):
+            # Skip self and the members that are failed or have left
+            if node_id == self.node_id or not self.is_alive(node_id):
+                continue
+            peers.append((node_id, connect(member.get("address"), member.get("port")),))
+        return peers
+
+    # Get new connections to every other member that has not left, failed ones too, as a list of (node id, connection)
+    # Replication sends to the alive ones and keeps hints for the failed ones
+    def replicas(self):
+        with self.lock:
+            members = [(node_id, member.get("address"), member.get("port"),)
+                       for node_id, member in self.members.items()
+                       if node_id != self.node_id and member.get("status") != "left"]
+        return [(node_id, connect(address, port),) for node_id, address, port in members]
+
+    # Keep updates a member missed so they can be handed off once it comes back, the oldest are dropped over the limit
+    def hint(self, node_id, updates):
+        with self.hints_lock:
+            hints = self.hints.setdefault(node_id, [])
+            hints.extend(updates)
+            del hints[:max(0, len(hints) - cfg.hint_limit)]
+
+    # Take the updates kept for a member, in the order they happened
+    def take_hints(self, node_id):
+        with self.hints_lock:
+            return self.hints.pop(node_id, [])
+
+    # Get the member that owns a key for atomic operations, every node with the same view picks the same one
+    def owner(self, key):
+        alive = [node_id for node_id in list(self.members) if node_id == self.node_id or self.is_alive(node_id)]
+        return max(alive, key=lambda node_id: zlib.crc32("{}:{}".format(node_id, key).encode("utf-8")))
+
+    # Get a new connection to a member, without a timeout unless one is given
+    # No timeout is for calls that must not be given up on once they were sent
+    def connection(self, node_id, timeout=None):
+        member = self.members.get(node_id)
+        return connect(member.get("address"), member.get("port"), timeout)
+
+    # Treat a member as failed right away, used when it refused a connection before the failure timeout ran out
+    # A newer heartbeat from the member brings it back like any other failed member
+    def suspect(self, node_id):
+        with self.lock:
+            if node_id in self.last_updated:
+                self.last_updated[node_id] = time.monotonic() - cfg.failure_timeout
+
+    # Get the member table in the form sent over XML RPC, dictionary keys have to be strings
+    def table(self):
+        with self.lock:
+            return {str(node_id): dict(member) for node_id, member in self.members.items()}
+
+    # Merge a member table from another node into this one, the newer heartbeat of each member wins
+    def merge(self, table):
+        # Members that came back under the same incarnation, their hints are handed off after the lock is released
+        recovered = []
+        with self.lock:
+            for member in table.values():
+                node_id = member.get("node_id")
+                # Nobody else gets to say anything about this node
+                if node_id == self.node_id:
+                    continue
+                current = self.members.get(node_id)
+                # Compare on incarnation first so a restarted node replaces its old entry
+                if current is None or (member.get("incarnation"), member.get("heartbeat")) > \
+                        (current.get("incarnation"), current.get("heartbeat")):
+                    # Print when a member joins, comes back after failing, or leaves
+                    was_alive = current is not None and current.get("status") == "alive" and \
+                        time.monotonic() - self.last_updated[node_id] < cfg.failure_timeout
+                    if self.verbose and (not was_alive or member.get("status") != "alive"):
+                        print("Node {} Membership! -> Node {} {}".format(self.node_id, node_id, member.get("status")))
+                    # A member that left or restarted does not need the hints, a restarted one syncs from a snapshot
+                    if current is not None and (member.get("status") != "alive" or
+                                                member.get("incarnation") != current.get("incarnation")):
+                        self.take_hints(node_id)
+                    elif current is not None and not was_alive:
+                        recovered.append(node_id)
+                    self.members[node_id] = dict(member)
+                    self.last_updated[node_id] = time.monotonic()
+        if self.on_recover is not None:
+            for node_id in recovered:
+                self.on_recover(node_id)
+
+    # Bump the heartbeat of this node
+    def beat(self):
+        with self.lock:
+            self.members[self.node_id]["heartbeat"] += 1
+            self.last_updated[self.node_id] = time.monotonic()
+
+    # Exchange tables with one member, the answer is the other member's table
+    def gossip_with(self, node_id):
+        member = self.members.get(node_id)
+        try:
+            self.merge(connect(member.get("address"), member.get("port")).gossip(self.table()))
+        # The member did not answer, the failure timeout takes care of it
+        except (OSError, xmlrpc.client.Error):
+            pass
+
+    # Mark this node as left, tell the other members right away, and stop the gossip worker
+    def leave(self):
+        with self.lock:
+            self.members[self.node_id]["status"] = "left"
+        self.beat()
+        # Tell the other members directly instead of waiting for the next round
+        for node_id, _ in self.peers():
+            self.gossip_with(node_id)
+        self.stop_event.set()
+
+
+# Static worker thread to gossip with random members every gossip interval
+def gossip_worker(membership):
+    # Run until the node leaves
+    while not membership.stop_event.is_set():
+        # Bump the heartbeat of this node
+        membership.beat()
+        # Pick from every member that has not left, failed ones too so a member that comes back gets noticed
+        with membership.lock:
+            targets = [node_id for node_id, member in membership.members.items()
+                       if node_id != membership.node_id and member.get("status") != "left"]
+        # Gossip with a few random members
+        for node_id in random.sample(targets, min(cfg.gossip_fanout, len(targets))):
+            membership.gossip_with(node_id)
+        # Wait for the next round, wakes up early if the node leaves
+        membership.stop_event.wait(cfg.gossip_interval)
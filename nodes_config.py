@@ -21,3 +21,63 @@ nodes = [
         "node_id": 3
     }
 ]
+
+"""
+Configuration for the replication workers in sequential and linearizable
+- Update Linger: seconds a worker waits for more updates before sending a batch, 0 sends right away
+- Update Batch Size: most updates sent to the other nodes in one call
+"""
+update_linger = 0.0
+update_batch_size = 100
+
+"""
+Configuration for the gossip membership, the nodes above are used as seeds to join the cluster
+- Gossip Interval: seconds between gossip rounds
+- Gossip Fanout: number of random members to gossip with each round
+- Failure Timeout: seconds without a new heartbeat before a member is considered failed
+- RPC Timeout: seconds before a call to another node gives up
+- Retry Delay: seconds to wait before retrying a failed update to another node
+- Hint Limit: most missed updates kept for a failed member to hand off when it comes back, the oldest are dropped
+"""
+gossip_interval = 0.5
+gossip_fanout = 2
+failure_timeout = 3.0
+rpc_timeout = 2.0
+retry_delay = 0.1
+hint_limit = 100000
+
+"""
+Configuration for syncing a new or restarted node from a snapshot of another node
+- Snapshot Chunk Size: most key/value pairs sent in one chunk
+- Snapshot Chunk Bytes: most bytes of keys and values sent in one chunk, large values only count their description
+- Snapshot Timeout: seconds before a snapshot that was never fully read is dropped
+"""
+snapshot_chunk_size = 1000
+snapshot_chunk_bytes = 1024 * 1024
+snapshot_timeout = 60.0
+
+"""
+Configuration for sharding, running each node as one process per shard to use more cores
+- Shards: number of shard processes per node, 1 runs the node as a single process
+- Shard Port Offset: shard n of a node listens on the node's port + offset * (n + 1)
+"""
+shards = 1
+shard_port_offset = 1000
+
+"""
+Configuration for the log of changed keys that cached clients use to drop stale values
+- Invalidation Log Size: number of recent changes kept, a client further behind drops its whole cache
+"""
+invalidation_log_size = 10000
+
+"""
+Configuration for large values, sent compressed in chunks instead of as one escaped string
+- Large Value Size: values of at least this many bytes are sent as large values
+- Value Chunk Size: bytes sent in one chunk of a large value
+- Value Compression: codec for large values, "lz4" (falls back to zlib when lz4 is not installed), "zlib", or "none"
+- Upload Timeout: seconds before the chunks of an upload that was never finished are dropped
+"""
+large_value_size = 64 * 1024
+value_chunk_size = 256 * 1024
+value_compression = "lz4"
+upload_timeout = 60.0
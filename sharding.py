@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+# Import the configuration file for the nodes to get the shard settings
+import nodes_config as cfg
+
+# Import XML RPC server for the router that sits in front of the shards
+from xmlrpc.server import SimpleXMLRPCServer
+
+# Import socketserver so the router can handle requests on more than one thread
+import socketserver
+
+# Import XML RPC client to forward requests to the shards
+import xmlrpc.client
+
+# Import threading for a connection per router thread and the shutdown signal
+import threading
+
+# Import zlib for a hash of the key that is the same in every process
+import zlib
+
+"""
+Sharding for running one kv node as several processes so it can use every core on the host.
+Each shard is a normal kv node process that owns the keys hashing to it, listening on its own port and replicating
+only with the same shard on the other nodes. The router on the node's configured port forwards each request to the
+shard that owns the key, and clients that want to skip the extra hop can use ShardedNodeProxy to go straight to the
+shards.
+"""
+
+# Methods that go to every shard instead of the one owning a key
+BROADCAST_METHODS = ["flush", "shutdown"]
+
+# Methods for a single key, with the position of the key in the arguments
+KEYED_METHODS = {"put": 0, "get": 0, "remove": 0, "update": 0, "update_remove": 0, "cas": 0, "incr": 0,
+                 "put_if_absent": 0, "atomic": 1, "apply_atomic": 1, "atomic_put": 0, "update_versioned": 0,
+                 "upload_chunk": 0, "put_upload": 0, "update_upload": 0, "get_chunk": 0}
+
+# Methods about the state of one shard, the other nodes and clients have to call the shard directly
+SHARD_METHODS = ["gossip", "snapshot_chunk", "invalidations", "update_batch"]
+
+
+# Get the port a shard of a node listens on
+def shard_port(port, shard):
+    return port + cfg.shard_port_offset * (shard + 1)
+
+
+# Get the shard that owns a key
+def shard_for(key, shards):
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+# Check if a request should go to the shard owning its key
+def is_keyed(method, params):
+    return method in KEYED_METHODS and len(params) > KEYED_METHODS[method]
+
+
+# Get the shard a request goes to, None when it is not for a single key
+def route(method, params, shards):
+    if is_keyed(method, params):
+        return shard_for(params[KEYED_METHODS[method]], shards)
+    # Sending these to one of the shards would only answer for that shard
+    if method in SHARD_METHODS:
+        raise ValueError("{} has to be sent to a shard directly".format(method))
+    return None
+
+
+# XML RPC server that handles each request on its own thread
+class ThreadingXMLRPCServer(socketserver.ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+
+# Class for the router in front of the shards of a node
+class ShardRouter:
+    def __init__(self, address, port, node_id, shards, verbose):
+        # Set the address
+        self.address = address
+        # Set the port
+        self.port = port
+        # Set the node id
+        self.node_id = node_id
+        # Addresses of the shards in order
+        self.shard_addresses = [[address, shard_port(port, shard)] for shard in range(shards)]
+        # Connections to the shards for each router thread, a connection can not be shared between threads
+        self.local = threading.local()
+        # Set when the node has been told to shut down
+        self.shutdown_event = threading.Event()
+        # Verbose logging option for more data to be printed
+        self.verbose = verbose
+
+    # Get the connection to a shard for the current thread
+    def shard(self, shard):
+        if not hasattr(self.local, "proxies"):
+            self.local.proxies = [xmlrpc.client.ServerProxy("http://" + address + ":" + str(port), allow_none=True)
+                                  for address, port in self.shard_addresses]
+        return self.local.proxies[shard]
+
+    # Called by the XML RPC server for every request, forward it to the right shard
+    def _dispatch(self, method, params):
+        # Tell clients where the shards are so they can go to them directly
+        if method == "shards":
+            return self.shard_addresses
+
+        # Flush and shutdown have to reach every shard
+        if method in BROADCAST_METHODS:
+            for shard in range(len(self.shard_addresses)):
+                getattr(self.shard(shard), method)(*params)
+            if method == "shutdown":
+                # Let the server listener thread know it can stop
+                self.shutdown_event.set()
+
+                if self.verbose:
+                    print("Node {} Router Shutdown!".format(self.node_id))
+
+            return True
+
+        # Requests for a key go to the shard that owns it, everything else to the first shard
+        shard = route(method, params, len(self.shard_addresses))
+        return getattr(self.shard(0 if shard is None else shard), method)(*params)
+
+
+# Client side connection to a sharded node that sends each request straight to the shard owning the key
+class ShardedNodeProxy:
+    def __init__(self, address, port):
+        # Connection to the router for the requests that are not for a single key
+        self.router = xmlrpc.client.ServerProxy("http://" + address + ":" + str(port), allow_none=True)
+        # Connections to each of the shards, in the same order the router uses
+        self.shards = [xmlrpc.client.ServerProxy("http://" + shard_address + ":" + str(shard_port_number),
+                                                 allow_none=True)
+                       for shard_address, shard_port_number in self.router.shards()]
+
+    # Look up a method the same way ServerProxy does and route the call when it is made
+    def __getattr__(self, method):
+        def call(*params):
+            shard = route(method, params, len(self.shards))
+            if shard is not None:
+                return getattr(self.shards[shard], method)(*params)
+            return getattr(self.router, method)(*params)
+        return call
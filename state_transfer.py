@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+# Import the configuration file for the nodes to get the snapshot settings
+import nodes_config as cfg
+
+# Import XML RPC client for the errors when a peer can not send its snapshot
+import xmlrpc.client
+
+# Import threading to lock the buffered writes
+import threading
+
+# Import time to expire snapshots that were never finished
+import time
+
+# Import the large value support so a snapshot only describes large values and they are read in chunks
+from blobs import read_blob, reply_value
+
+"""
+Bulk state transfer for a new or restarted kv node.
+When a node starts it streams a snapshot of the store from one of the alive members in chunks. Replicated writes that
+arrive while the snapshot is being streamed are buffered and applied in order once the snapshot is loaded, so they
+are not overwritten by the older values in the snapshot.
+"""
+
+
+# Class for the snapshots a node serves to others and the writes it buffers while syncing itself
+class StateTransfer:
+    def __init__(self, node_id, verbose):
+        # Set the node id
+        self.node_id = node_id
+        # Verbose logging option for more data to be printed
+        self.verbose = verbose
+        # Snapshots being streamed to other nodes keyed by snapshot id, each is (created time, items)
+        self.snapshots = {}
+        # Counter for the snapshot ids
+        self.next_snapshot_id = 0
+        # Writes that arrived while this node was syncing, in order
+        self.buffer = []
+        # The node starts out syncing until the snapshot has been loaded
+        self.syncing = True
+        # Set once the sync has finished, for the operations that need the whole store
+        self.synced = threading.Event()
+        # Lock for the buffer because the sync worker and the XML RPC server both use it
+        self.lock = threading.Lock()
+
+    # Hold on to a write while the node is syncing, returns True if the write was buffered
+    def hold(self, update_value):
+        with self.lock:
+            if self.syncing:
+                self.buffer.append(update_value)
+                return True
+            return False
+
+    # Get the next chunk of a snapshot of the data, an empty snapshot id starts a new snapshot
+    def snapshot_chunk(self, data, snapshot_id, offset):
+        # Lock so two snapshots started at the same time do not get the same id
+        with self.lock:
+            if snapshot_id == "":
+                # A node that is still syncing only has part of the data, the other node has to ask someone else
+                if self.syncing:
+                    raise RuntimeError("Node {} is still syncing".format(self.node_id))
+                # Drop the snapshots the other node never finished reading
+                now = time.monotonic()
+                for old_id, (created, _) in list(self.snapshots.items()):
+                    if now - created > cfg.snapshot_timeout:
+                        self.snapshots.pop(old_id)
+                # Copy the items once so every chunk comes from the same point in time
+                snapshot_id = str(self.next_snapshot_id)
+                self.next_snapshot_id += 1
+                self.snapshots[snapshot_id] = (now, list(data.items()),)
+
+                if self.verbose:
+                    print("Node {} Snapshot! -> {} Keys".format(self.node_id, len(self.snapshots[snapshot_id][1])))
+
+            items = self.snapshots[snapshot_id][1]
+            # Fill the chunk up to the pair count or the byte size, whichever comes first, with at least one pair
+            chunk = []
+            size = 0
+            for key, value in items[offset:offset + cfg.snapshot_chunk_size]:
+                value = reply_value(value)
+                size += len(key) + len(str(value))
+                if chunk and size > cfg.snapshot_chunk_bytes:
+                    break
+                chunk.append([key, value])
+            done = offset + len(chunk) >= len(items)
+            # Release the snapshot once the last chunk has been handed out
+            if done:
+                self.snapshots.pop(snapshot_id)
+            return {"snapshot_id": snapshot_id, "items": chunk, "done": done}
+
+    # Stream a snapshot from one of the alive members into the data, then apply the buffered writes
+    def sync(self, data, membership, invalidation_log):
+        # Tell the other members about this node first so they replicate to it before the snapshot is taken
+        for node_id, _ in membership.peers():
+            membership.gossip_with(node_id)
+
+        # Try each of the alive members until one of them sends a full snapshot
+        for node_id, node in membership.peers():
+            try:
+                snapshot_id = ""
+                offset = 0
+                while True:
+                    chunk = node.snapshot_chunk(snapshot_id, offset)
+                    snapshot_id = chunk.get("snapshot_id")
+                    # Load the chunk straight into the data
+                    for key, value in chunk.get("items"):
+                        # Large values are only described, read their chunks separately
+                        if isinstance(value, dict):
+                            value = read_blob(node, key, value)
+                            # The value changed since the snapshot, the change reaches this node as a buffered write
+                            if value is None:
+                                continue
+                        data[key] = value
+                    offset += len(chunk.get("items"))
+                    if chunk.get("done"):
+                        break
+
+                if self.verbose:
+                    print("Node {} Synced! -> {} Keys from Node {}".format(self.node_id, offset, node_id))
+                break
+            # The member could not send the snapshot or is still syncing itself, try the next one
+            except (OSError, xmlrpc.client.Error):
+                continue
+
+        self.finish(data, invalidation_log)
+
+    # Apply the buffered writes in order and stop buffering
+    def finish(self, data, invalidation_log):
+        with self.lock:
+            for update_value in self.buffer:
+                if update_value[0] == "PUT":
+                    data[update_value[1]] = update_value[2]
+                elif update_value[0] == "REMOVE":
+                    data.pop(update_value[1], None)
+            self.buffer = []
+            self.syncing = False
+            self.synced.set()
+        # The keys loaded during the sync were not recorded one by one, so cached clients have to drop everything
+        invalidation_log.reset()
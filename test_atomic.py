@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Import pytest to run the contention check for every mode
+import pytest
+
+# Import the configuration file for the nodes to find their addresses
+import nodes_config as cfg
+
+# Import the driver to start and stop the kv nodes
+import driver
+
+# Import the atomic operations to test them on their own
+from kv_node import apply_atomic_op
+
+# Import XML RPC client to call the kv nodes
+import xmlrpc.client
+
+# Import threading to run the clients at the same time
+import threading
+
+# Import time to wait for the nodes to find each other
+import time
+
+
+# Stand in for a node that keeps the puts of atomic operations in a dictionary
+class FakeNode:
+    def __init__(self):
+        self.data = {}
+
+    def atomic_put(self, key, value):
+        self.data[key] = value
+
+
+# Each atomic operation only changes the value when its condition holds
+def test_apply_atomic_op():
+    node = FakeNode()
+    assert apply_atomic_op(node, "INCR", "counter", [5]) == 5
+    assert apply_atomic_op(node, "INCR", "counter", [-2]) == 3
+    assert node.data.get("counter") == "3"
+    assert apply_atomic_op(node, "CAS", "lock", ["NULL", "me"])
+    assert not apply_atomic_op(node, "CAS", "lock", ["NULL", "you"])
+    assert apply_atomic_op(node, "CAS", "lock", ["me", "free"])
+    assert node.data.get("lock") == "free"
+    assert apply_atomic_op(node, "PUT_IF_ABSENT", "x", ["1"])
+    assert not apply_atomic_op(node, "PUT_IF_ABSENT", "x", ["2"])
+    assert node.data.get("x") == "1"
+
+
+# An increment past what XML RPC can send back is refused without changing the value
+def test_incr_out_of_range():
+    node = FakeNode()
+    node.data["counter"] = str(xmlrpc.client.MAXINT)
+    with pytest.raises(OverflowError):
+        apply_atomic_op(node, "INCR", "counter", [1])
+    assert node.data.get("counter") == str(xmlrpc.client.MAXINT)
+
+
+# Clients incrementing the same counter through different nodes never lose an increment
+@pytest.mark.parametrize("mode", ["eventual", "sequential", "linearizable"])
+def test_incr_contention(mode):
+    clients = 4
+    increments = 50
+    urls = ["http://{}:{}".format(node.get("address"), node.get("port")) for node in cfg.nodes]
+    driver.init_kv_nodes(mode, False)
+    try:
+        # Give the nodes time to find each other
+        time.sleep(1.5)
+
+        # Each client spreads its increments over every node
+        def work(i):
+            for j in range(increments):
+                node = xmlrpc.client.ServerProxy(urls[(i + j) % len(urls)])
+                node.incr("counter", 1)
+
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        nodes = [xmlrpc.client.ServerProxy(url) for url in urls]
+        for node in nodes:
+            node.flush()
+        assert [node.get("counter") for node in nodes] == [str(clients * increments)] * len(nodes)
+    finally:
+        driver.kill_kv_nodes(mode)
+
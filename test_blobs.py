@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Import os for bytes that do not compress
+import os
+
+# Import XML RPC client for the binary chunks
+import xmlrpc.client
+
+# Import zlib to compress a value by hand
+import zlib
+
+# Import the configuration file for the nodes to change the large value settings
+import nodes_config as cfg
+
+# Import the large value support to test it
+import blobs
+from blobs import Blob, Uploads, LargeValueProxy, compress, decompress
+
+# Import the replication of batches to check large values are sent in order
+from kv_node import send_updates
+
+
+# Compressing falls back to zlib when lz4 is not installed
+def test_compress_without_lz4(monkeypatch):
+    monkeypatch.setattr(cfg, "value_compression", "lz4")
+    monkeypatch.setattr(blobs, "lz4", None)
+    data = b"abc" * 10000
+    codec, compressed = compress(data)
+    assert codec == "zlib"
+    assert decompress(codec, compressed) == data
+
+
+# Values that do not get smaller, or no compression configured, are kept as they are
+def test_compress_none(monkeypatch):
+    data = os.urandom(10000)
+    assert compress(data) == ("none", data,)
+    monkeypatch.setattr(cfg, "value_compression", "none")
+    assert compress(b"abc" * 10000) == ("none", b"abc" * 10000,)
+
+
+# Chunks are put back together in index order, a chunk sent again replaces the first one
+def test_uploads_reassembly():
+    uploads = Uploads()
+    uploads.add("u", 1, xmlrpc.client.Binary(b"world"))
+    uploads.add("u", 0, b"hello ")
+    uploads.add("u", 1, b"there")
+    assert uploads.take("u") == b"hello there"
+    assert uploads.uploads == {}
+
+
+# An upload that was never finished is dropped so a restarted upload starts clean
+def test_uploads_restart(monkeypatch):
+    uploads = Uploads()
+    uploads.add("u", 0, b"old")
+    uploads.add("u", 1, b"old")
+    monkeypatch.setattr(cfg, "upload_timeout", -1.0)
+    uploads.add("u", 0, b"new")
+    assert uploads.take("u") == b"new"
+
+
+# Stand in for a node holding one large value that changes after the first chunk was read
+class FakeNode:
+    def __init__(self, old, new):
+        self.values = [old, new]
+        self.changed = False
+
+    def get(self, key):
+        blob = self.values[-1] if self.changed else self.values[0]
+        return blobs.reply_value(blob)
+
+    def get_chunk(self, key, blob_id, offset):
+        blob = self.values[-1] if self.changed else self.values[0]
+        # The value changes once a chunk of the old one has been read
+        if blob_id != blob.blob_id:
+            return "NULL"
+        self.changed = True
+        return xmlrpc.client.Binary(blob.data[offset:offset + cfg.value_chunk_size])
+
+    def remove(self, key):
+        return blobs.reply_value(self.values[-1])
+
+
+# A get starts over with the new value when the value changes in the middle of reading it
+def test_large_value_get_restart(monkeypatch):
+    monkeypatch.setattr(cfg, "value_chunk_size", 4)
+    old = Blob("old", "zlib", zlib.compress(b"old value"))
+    new = Blob("new", "none", b"new value")
+    proxy = LargeValueProxy(FakeNode(old, new))
+    assert proxy.get("key") == "new value"
+
+
+# Removing a large value only says a large value was removed
+def test_large_value_remove():
+    proxy = LargeValueProxy(FakeNode(Blob("a", "none", b"a"), Blob("a", "none", b"a")))
+    assert proxy.remove("key") == "LARGE_VALUE"
+
+
+# Stand in for a node that records the replication calls and answers them with a set acknowledgement
+class FakeReplica:
+    def __init__(self, acknowledge):
+        self.acknowledge = acknowledge
+        self.calls = []
+
+    def update_batch(self, updates):
+        self.calls.append(["batch", updates])
+        return self.acknowledge
+
+    def upload_chunk(self, key, upload_id, index, data):
+        pass
+
+    def update_upload(self, key, upload_id, codec):
+        self.calls.append(["upload", key])
+        return True
+
+
+# Large values are sent in order between the small updates and a refused batch is not acknowledged
+def test_send_updates():
+    updates = [("PUT", "a", "1",), ("PUT", "big", Blob("id", "none", b"x"),), ("REMOVE", "a",)]
+    node = FakeReplica(True)
+    assert send_updates(node, updates)
+    assert node.calls == [["batch", [updates[0]]], ["upload", "big"], ["batch", [updates[2]]]]
+    assert not send_updates(FakeReplica(None), updates)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+# Import the configurations to change the log and refresh settings
+import nodes_config
+import clients_config
+
+# Import the cache to test the invalidation log and the cached client
+from cache import InvalidationLog, CachedNodeProxy
+
+
+# Changed keys come back once each, in the order they changed
+def test_since_returns_changed_keys():
+    log = InvalidationLog()
+    for key in ["a", "b", "a", "c"]:
+        log.record(key)
+    changes = log.since(log.epoch, 1)
+    assert changes == {"epoch": log.epoch, "seq": 4, "reset": False, "keys": ["b", "a", "c"]}
+    assert log.since(log.epoch, 4).get("keys") == []
+
+
+# A client that fell behind the start of the log has to drop everything
+def test_since_resets_on_gap(monkeypatch):
+    monkeypatch.setattr(nodes_config, "invalidation_log_size", 3)
+    log = InvalidationLog()
+    for key in ["a", "b", "c", "d", "e"]:
+        log.record(key)
+    assert log.since(log.epoch, 1).get("reset")
+    changes = log.since(log.epoch, 2)
+    assert not changes.get("reset")
+    assert changes.get("keys") == ["c", "d", "e"]
+    # A change number ahead of the log is from another run of the node
+    assert log.since(log.epoch, 6).get("reset")
+
+
+# A new epoch tells every client to drop everything
+def test_since_resets_on_new_epoch():
+    log = InvalidationLog()
+    log.record("a")
+    epoch = log.epoch
+    log.reset()
+    log.epoch = epoch + 1
+    changes = log.since(epoch, 1)
+    assert changes == {"epoch": epoch + 1, "seq": 0, "reset": True, "keys": []}
+
+
+# Stand in for a node that answers invalidations from a scripted list
+class FakeNode:
+    def __init__(self, answers):
+        self.answers = answers
+        self.asked = []
+
+    def invalidations(self, epoch, seq):
+        self.asked.append((epoch, seq,))
+        return self.answers.pop(0)
+
+
+# Refresh drops the changed keys, clears everything on a reset, and remembers where it got to
+def test_refresh(monkeypatch):
+    monkeypatch.setattr(clients_config, "cache_refresh", 0.0)
+    node = FakeNode([{"epoch": 5.0, "seq": 2, "reset": True, "keys": []},
+                     {"epoch": 5.0, "seq": 3, "reset": False, "keys": ["a"]}])
+    proxy = CachedNodeProxy(node, "eventual")
+    proxy.store("a", "1")
+    proxy.store("b", "2")
+    proxy.refresh()
+    assert len(proxy.cache) == 0
+    proxy.store("a", "1")
+    proxy.store("b", "2")
+    proxy.refresh()
+    assert list(proxy.cache) == ["b"]
+    assert node.asked == [(0.0, 0,), (5.0, 2,)]
+    assert proxy.cursors == [(5.0, 3,)]
+
+
+# Refresh only asks the node once per refresh interval
+def test_refresh_interval(monkeypatch):
+    monkeypatch.setattr(clients_config, "cache_refresh", 60.0)
+    node = FakeNode([{"epoch": 5.0, "seq": 0, "reset": False, "keys": []}])
+    proxy = CachedNodeProxy(node, "eventual")
+    proxy.refresh()
+    proxy.refresh()
+    assert len(node.asked) == 1
+
+
+# Stand in for a node that returns fresh values and the keys changed since the last refresh
+class FakeValueNode(FakeNode):
+    def __init__(self, values, answers):
+        super().__init__(answers)
+        self.values = values
+
+    def get(self, key):
+        return self.values.get(key)
+
+
+# A sequential client that reads a newer value from the node drops the older cached values right after
+def test_sequential_miss_refreshes(monkeypatch):
+    monkeypatch.setattr(clients_config, "cache_refresh", 60.0)
+    node = FakeValueNode({"x": "new", "y": "new"},
+                         [{"epoch": 5.0, "seq": 0, "reset": False, "keys": []},
+                          {"epoch": 5.0, "seq": 2, "reset": False, "keys": ["x", "y"]},
+                          {"epoch": 5.0, "seq": 2, "reset": False, "keys": []}])
+    proxy = CachedNodeProxy(node, "sequential")
+    proxy.refresh()
+    proxy.store("x", "old")
+    assert proxy.get("y") == "new"
+    assert "x" not in proxy.cache
+    assert proxy.get("x") == "new"
+    assert len(node.asked) == 3
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Import queue for the update queue the workers read from
+import queue
+
+# Import threading to add updates while a batch is being collected
+import threading
+
+# Import time to check how long a batch waits
+import time
+
+# Import the batching of the replication workers to test it
+from kv_node import next_update_batch
+
+
+# Get a queue with the given values already in it
+def filled_queue(values):
+    update_queue = queue.Queue()
+    for value in values:
+        update_queue.put(value)
+    return update_queue
+
+
+# Without a linger only the updates already waiting are taken, up to the batch size
+def test_batch_cap():
+    update_queue = filled_queue([("PUT", str(i), "v",) for i in range(5)])
+    assert [update_value[1] for update_value in next_update_batch(update_queue, 0.0, 3)] == ["0", "1", "2"]
+    assert [update_value[1] for update_value in next_update_batch(update_queue, 0.0, 3)] == ["3", "4"]
+
+
+# The batch stops at the shutdown signal and leaves what comes after it in the queue
+def test_batch_stops_at_none():
+    update_queue = filled_queue([("PUT", "a", "1",), None, ("PUT", "b", "2",)])
+    assert next_update_batch(update_queue, 0.0, 100) == [("PUT", "a", "1",), None]
+    assert update_queue.qsize() == 1
+
+
+# Updates that arrive within the linger window go in the same batch, the batch does not wait past it
+def test_batch_linger():
+    update_queue = filled_queue([("PUT", "a", "1",)])
+    threading.Timer(0.05, update_queue.put, args=(("PUT", "b", "2",),)).start()
+    start = time.monotonic()
+    batch = next_update_batch(update_queue, 0.3, 100)
+    assert batch == [("PUT", "a", "1",), ("PUT", "b", "2",)]
+    assert time.monotonic() - start >= 0.25
+
+
+# A full batch is sent right away without waiting for the rest of the linger window
+def test_batch_full_skips_linger():
+    update_queue = filled_queue([("PUT", str(i), "v",) for i in range(3)])
+    start = time.monotonic()
+    assert len(next_update_batch(update_queue, 5.0, 3)) == 3
+    assert time.monotonic() - start < 1.0
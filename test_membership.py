@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+# Import the configuration file for the nodes to change the membership settings
+import nodes_config as cfg
+
+# Import the membership to test it
+from membership import Membership
+
+# Import time to move heartbeats into the past
+import time
+
+
+# Get an entry of the member table as another node would send it
+def entry(node_id, incarnation, heartbeat, status="alive"):
+    return {"node_id": node_id, "address": "127.0.0.1", "port": 34565 + node_id,
+            "incarnation": incarnation, "heartbeat": heartbeat, "status": status}
+
+
+# Make a member look like its heartbeat stopped going up longer than the failure timeout ago
+def expire(membership, node_id):
+    membership.last_updated[node_id] = time.monotonic() - cfg.failure_timeout - 1
+
+
+# A heartbeat older than the one already known is ignored, a higher incarnation always replaces the entry
+def test_merge_keeps_newest():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    membership.merge({"2": entry(2, 5.0, 10)})
+    membership.merge({"2": entry(2, 5.0, 3)})
+    assert membership.members[2].get("heartbeat") == 10
+    membership.merge({"2": entry(2, 6.0, 0)})
+    assert membership.members[2].get("incarnation") == 6.0
+    assert membership.members[2].get("heartbeat") == 0
+
+
+# Nobody else gets to change this node's own entry
+def test_merge_ignores_self():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    membership.merge({"1": entry(1, 99.0, 99, "left")})
+    assert membership.members[1].get("status") == "alive"
+    assert membership.members[1].get("incarnation") == membership.incarnation
+
+
+# A member is failed after the failure timeout and alive again once its heartbeat goes up
+def test_is_alive():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    membership.merge({"2": entry(2, 5.0, 1)})
+    assert membership.is_alive(2)
+    expire(membership, 2)
+    assert not membership.is_alive(2)
+    assert 2 not in [node_id for node_id, _ in membership.peers()]
+    membership.merge({"2": entry(2, 5.0, 2)})
+    assert membership.is_alive(2)
+    membership.merge({"2": entry(2, 5.0, 3, "left")})
+    assert not membership.is_alive(2)
+    assert not membership.is_alive(9)
+
+
+# A suspected member is failed right away until a newer heartbeat shows up
+def test_suspect():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    membership.merge({"2": entry(2, 5.0, 1)})
+    membership.suspect(2)
+    assert not membership.is_alive(2)
+    membership.merge({"2": entry(2, 5.0, 2)})
+    assert membership.is_alive(2)
+
+
+# Every node with the same view picks the same owner, and failed members are skipped
+def test_owner():
+    memberships = [Membership("127.0.0.1", 34565 + node_id, node_id, False) for node_id in [1, 2, 3]]
+    keys = ["key{}".format(i) for i in range(100)]
+    owners = [[membership.owner(key) for key in keys] for membership in memberships]
+    assert owners[0] == owners[1] == owners[2]
+    assert set(owners[0]) == {1, 2, 3}
+    # Only the keys of the failed member move, the others keep their owner
+    expire(memberships[0], 3)
+    for key, owner in zip(keys, owners[0]):
+        assert memberships[0].owner(key) == owner if owner != 3 else memberships[0].owner(key) in [1, 2]
+
+
+# The hints of a member that comes back under the same incarnation are handed off
+def test_recover_hands_off():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    recovered = []
+    membership.on_recover = recovered.append
+    membership.merge({"2": entry(2, 5.0, 1)})
+    expire(membership, 2)
+    membership.hint(2, [("PUT", "a", "1",)])
+    membership.hint(2, [("REMOVE", "a",)])
+    membership.merge({"2": entry(2, 5.0, 2)})
+    assert recovered == [2]
+    assert membership.take_hints(2) == [("PUT", "a", "1",), ("REMOVE", "a",)]
+    assert membership.take_hints(2) == []
+
+
+# A member that restarted or left does not get the hints, a restarted one syncs from a snapshot
+def test_restart_drops_hints():
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    recovered = []
+    membership.on_recover = recovered.append
+    membership.merge({"2": entry(2, 5.0, 1), "3": entry(3, 5.0, 1)})
+    expire(membership, 2)
+    membership.hint(2, [("PUT", "a", "1",)])
+    membership.hint(3, [("PUT", "a", "1",)])
+    membership.merge({"2": entry(2, 6.0, 0), "3": entry(3, 5.0, 2, "left")})
+    assert recovered == []
+    assert membership.take_hints(2) == []
+    assert membership.take_hints(3) == []
+
+
+# Only the newest hints are kept over the limit
+def test_hint_limit(monkeypatch):
+    monkeypatch.setattr(cfg, "hint_limit", 3)
+    membership = Membership("127.0.0.1", 34566, 1, False)
+    membership.hint(2, [("PUT", str(i), "v",) for i in range(5)])
+    assert [update_value[1] for update_value in membership.take_hints(2)] == ["2", "3", "4"]
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# Import zlib to check the shard against the hash every process uses
+import zlib
+
+# Import pytest to check the errors
+import pytest
+
+# Import the sharding helpers and the router to test them
+from sharding import shard_for, is_keyed, shard_port, ShardRouter
+
+
+# The same key always goes to the same shard, in range, and keys spread over every shard
+def test_shard_for():
+    keys = ["key{}".format(i) for i in range(1000)]
+    shards = [shard_for(key, 4) for key in keys]
+    assert shards == [shard_for(key, 4) for key in keys]
+    assert set(shards) == {0, 1, 2, 3}
+    assert shard_for("key0", 4) == zlib.crc32(b"key0") % 4
+    assert all(shard_for(key, 1) == 0 for key in keys)
+
+
+# Only the methods for a single key go to a single shard
+def test_is_keyed():
+    assert is_keyed("get", ["key"])
+    assert is_keyed("incr", ["key", 1])
+    assert is_keyed("apply_atomic", ["CAS", "key", ["NULL", "1"]])
+    assert not is_keyed("members", [])
+    assert not is_keyed("snapshot_chunk", ["0", 1000])
+    assert not is_keyed("flush", [])
+    assert not is_keyed("shutdown", ["key"])
+
+
+# Every shard gets its own port above the node's port
+def test_shard_port():
+    assert len({shard_port(34566, shard) for shard in range(4)}) == 4
+    assert all(shard_port(34566, shard) != 34566 for shard in range(4))
+
+
+# Stand in for the connection to a shard that records the calls it gets
+class FakeShard:
+    def __init__(self, shard, calls):
+        self.shard = shard
+        self.calls = calls
+
+    def __getattr__(self, method):
+        def call(*params):
+            self.calls.append((self.shard, method, list(params),))
+            return self.shard
+        return call
+
+
+# Get a router with two shards whose connections record the calls
+def fake_router(calls):
+    router = ShardRouter("127.0.0.1", 34566, 1, 2, False)
+    router.local.proxies = [FakeShard(shard, calls) for shard in range(2)]
+    return router
+
+
+# Keyed requests go to the shard owning the key, also when the key is not the first argument
+def test_router_keyed():
+    calls = []
+    router = fake_router(calls)
+    keys = ["key{}".format(i) for i in range(20)]
+    assert [router._dispatch("get", [key]) for key in keys] == [shard_for(key, 2) for key in keys]
+    assert router._dispatch("apply_atomic", ["INCR", "key3", [1]]) == shard_for("key3", 2)
+    assert calls[-1] == (shard_for("key3", 2), "apply_atomic", ["INCR", "key3", [1]],)
+
+
+# Flush and shutdown reach every shard, shutdown also stops the router
+def test_router_broadcast():
+    calls = []
+    router = fake_router(calls)
+    assert router._dispatch("flush", [])
+    assert calls == [(0, "flush", [],), (1, "flush", [],)]
+    assert not router.shutdown_event.is_set()
+    router._dispatch("shutdown", [])
+    assert router.shutdown_event.is_set()
+    assert calls[2:] == [(0, "shutdown", [],), (1, "shutdown", [],)]
+
+
+# Other requests go to the first shard, and requests about a single shard's state are refused
+def test_router_fallback():
+    calls = []
+    router = fake_router(calls)
+    assert router._dispatch("shards", []) == [["127.0.0.1", shard_port(34566, 0)], ["127.0.0.1", shard_port(34566, 1)]]
+    assert router._dispatch("members", []) == 0
+    assert calls == [(0, "members", [],)]
+    for method, params in [("invalidations", [1.5, 0]), ("snapshot_chunk", ["", 0]), ("gossip", [{}])]:
+        with pytest.raises(ValueError):
+            router._dispatch(method, params)
+    assert len(calls) == 1
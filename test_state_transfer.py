@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Import pytest to check the errors
+import pytest
+
+# Import the configuration file for the nodes to change the chunk size
+import nodes_config as cfg
+
+# Import the state transfer to test the snapshots
+from state_transfer import StateTransfer
+
+# Import Blob for the large values in a snapshot
+from blobs import Blob
+
+
+# Stand in for the invalidation log that only remembers whether it was reset
+class FakeLog:
+    def __init__(self):
+        self.was_reset = False
+
+    def reset(self):
+        self.was_reset = True
+
+
+# A node that is still syncing refuses to start a snapshot so the other node asks someone else
+def test_snapshot_refused_while_syncing():
+    state_transfer = StateTransfer(1, False)
+    with pytest.raises(RuntimeError):
+        state_transfer.snapshot_chunk({"a": "1"}, "", 0)
+
+
+# Writes held during the sync are applied in order on top of the snapshot
+def test_finish_applies_buffered_writes():
+    state_transfer = StateTransfer(1, False)
+    data = {"a": "old", "b": "old"}
+    assert state_transfer.hold(("PUT", "a", "new",))
+    assert state_transfer.hold(("REMOVE", "b",))
+    log = FakeLog()
+    state_transfer.finish(data, log)
+    assert data == {"a": "new"}
+    assert log.was_reset
+    assert not state_transfer.hold(("PUT", "c", "1",))
+
+
+# Every chunk of a snapshot comes from the same copy of the data
+def test_snapshot_chunks():
+    state_transfer = StateTransfer(1, False)
+    state_transfer.finish({}, FakeLog())
+    data = {"k{}".format(i): "v{}".format(i) for i in range(5)}
+    chunk = state_transfer.snapshot_chunk(data, "", 0)
+    data["late"] = "x"
+    items = list(chunk.get("items"))
+    while not chunk.get("done"):
+        chunk = state_transfer.snapshot_chunk(data, chunk.get("snapshot_id"), len(items))
+        items += chunk.get("items")
+    assert dict(items) == {"k{}".format(i): "v{}".format(i) for i in range(5)}
+    assert state_transfer.snapshots == {}
+
+
+# Chunks stop at the byte size and large values are only described
+def test_snapshot_chunk_bytes(monkeypatch):
+    monkeypatch.setattr(cfg, "snapshot_chunk_bytes", 100)
+    state_transfer = StateTransfer(1, False)
+    state_transfer.finish({}, FakeLog())
+    data = {"a": "x" * 60, "b": "x" * 60, "c": Blob("id", "zlib", b"x" * 1000)}
+    chunk = state_transfer.snapshot_chunk(data, "", 0)
+    assert chunk.get("items") == [["a", "x" * 60]]
+    chunk = state_transfer.snapshot_chunk(data, chunk.get("snapshot_id"), 1)
+    assert chunk.get("items") == [["b", "x" * 60]]
+    chunk = state_transfer.snapshot_chunk(data, chunk.get("snapshot_id"), 2)
+    assert chunk.get("items") == [["c", {"blob_id": "id", "codec": "zlib", "size": 1000}]]
+    assert chunk.get("done")